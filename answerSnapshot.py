@@ -0,0 +1,54 @@
+import gzip
+import json
+import os
+from datetime import datetime, timezone
+
+SNAPSHOT_VERSION = 1
+
+
+def save_snapshot(path, answer_set, workload_id, lens_alias, milestone_number=None):
+    """Writes all answers of a workload to a gzipped JSON file, written to a temporary file first"""
+    snapshot = {"version": SNAPSHOT_VERSION,
+                "createdAt": datetime.now(timezone.utc).isoformat(),
+                "workloadId": workload_id,
+                "lensAlias": lens_alias,
+                "milestoneNumber": milestone_number,
+                # "Index" is computed by AnswerSet when the snapshot is read back
+                "answers": {pillar: [{key: value for key, value in answer.items() if key != "Index"}
+                                     for answer in answers]
+                            for pillar, answers in answer_set.by_pillar.items()}}
+    tmp_path = "{}.tmp".format(path)
+    with gzip.open(tmp_path, "wt") as f:
+        json.dump(snapshot, f, separators=(",", ":"), default=str)
+    os.replace(tmp_path, path)
+
+def load_snapshot(path):
+    with gzip.open(path, "rt") as f:
+        snapshot = json.load(f)
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        raise ValueError("Snapshot {} has version {}, only version {} is supported".format(path,
+                                                                                         snapshot.get("version"),
+                                                                                         SNAPSHOT_VERSION))
+    return snapshot
+
+
+class SnapshotClient:
+    """Stands in for the wellarchitected boto3 client: list_answers is served from a snapshot, AWS is not called
+
+    Every pillar is returned as a single page, as a copy, so that the snapshot can be read any number of times.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.workload_id = snapshot["workloadId"]
+
+    def list_answers(self, WorkloadId, LensAlias, PillarId, **kwargs):
+        if WorkloadId != self.snapshot["workloadId"] or LensAlias != self.snapshot["lensAlias"]:
+            raise ValueError("Snapshot holds {} of lens {}, not {} of lens {}".format(self.snapshot["workloadId"],
+                                                                                    self.snapshot["lensAlias"],
+                                                                                    WorkloadId, LensAlias))
+        answers = json.loads(json.dumps(self.snapshot["answers"].get(PillarId, [])))
+        return {"WorkloadId": WorkloadId,
+                "MilestoneNumber": self.snapshot["milestoneNumber"],
+                "LensAlias": LensAlias,
+                "AnswerSummaries": answers}
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""Offline benchmark of create_tasks against local stand-ins of Jira, the documentation site and Well-Architected
+
+Starts HTTP stubs of the Jira REST/agile endpoints and of the best practice pages, with configurable latency
+and rate limits, serves a synthetic workload through a stub WA client, runs create_tasks end to end and reports
+wall time, requests per second, requests per endpoint and peak memory.
+
+Options not known to the benchmark are passed on to parseWAFR, e.g.:
+
+    python3 benchmark.py --questions 10 --choices 6 --stubJiraLatency 0.05 --stubJiraRateLimit 20 --bulkTransitions
+
+With --fromSnapshot the answers of a snapshot written by snapshotAnswers.py are used instead of the synthetic ones.
+--sync, --stateFile, --journalFile and --resume work as in parseWAFR.py, e.g. to measure a re-run. The state
+and journal files are kept in a wa2jira-benchmark temporary directory unless given, a journal is only written
+with --journalFile or --resume.
+"""
+
+import json
+import logging
+import math
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import argparse
+
+BENCHMARK_PROJECT = "BENCH"
+BENCHMARK_EPIC = "BENCH-0"
+BENCHMARK_WORKLOAD = "benchmark-workload"
+BENCHMARK_BOARD = "1"
+# state and journal of benchmark runs are kept apart from the ones of real parseWAFR.py runs
+BENCHMARK_DIR = os.path.join(tempfile.gettempdir(), "wa2jira-benchmark")
+BENCHMARK_STATE_FILE = os.path.join(BENCHMARK_DIR, "wa2jira-state.json")
+BENCHMARK_JOURNAL_FILE = os.path.join(BENCHMARK_DIR, "wa2jira-journal.jsonl")
+PILLARS = ["operationalExcellence", "security", "reliability", "performance", "costOptimization", "sustainability"]
+ANSWER_RISKS = ["HIGH", "MEDIUM", "NONE", "NOT_APPLICABLE"]
+PAGE_RISK_LEVELS = ["High", "Medium", "Low"]
+
+logger = logging.getLogger(__name__)
+
+PARSER = argparse.ArgumentParser(
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+    description=__doc__
+    )
+
+PARSER.add_argument('--questions', required=False, type=int, default=10, help='Questions per pillar of the synthetic workload')
+PARSER.add_argument('--choices', required=False, type=int, default=6, help='Choices per question, "None of these" not included')
+PARSER.add_argument('--selectedRatio', required=False, type=float, default=0.3, help='Share of the choices that are selected')
+PARSER.add_argument('--seed', required=False, type=int, default=1, help='Seed of the synthetic workload')
+PARSER.add_argument('--stubJiraLatency', required=False, type=float, default=0.02, help='Seconds added to every Jira response')
+PARSER.add_argument('--stubJiraRateLimit', required=False, type=float, default=0, help='Requests per second the Jira stub accepts before answering 429, 0 means no limit')
+PARSER.add_argument('--stubDocLatency', required=False, type=float, default=0.02, help='Seconds added to every documentation page response')
+PARSER.add_argument('--stubDocRateLimit', required=False, type=float, default=0, help='Requests per second the documentation stub accepts before answering 429, 0 means no limit')
+PARSER.add_argument('--pageSize', required=False, type=int, default=60, help='Size of the documentation pages in KB')
+PARSER.add_argument('--stubWaLatency', required=False, type=float, default=0.05, help='Seconds every list_answers call of the stub WA client takes')
+PARSER.add_argument('--outputFile', required=False, default=None, help='Also write the results as JSON to this file')
+PARSER.add_argument('-v','--debug', action='store_true', help='print debug messages of the run to stderr')
+
+
+class StubServer(ThreadingHTTPServer):
+    """Threaded HTTP server counting requests per endpoint, adding latency and answering 429 over `rate`"""
+
+    daemon_threads = True
+
+    def __init__(self, handler, latency=0, rate=0):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latency = latency
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.throttled = 0
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.state = {}
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.server_port)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="stub-{}".format(self.server_port), daemon=True).start()
+        return self
+
+    def admit(self, endpoint):
+        """Counts the request, returns the seconds to wait before retrying if it is over the rate limit"""
+        with self.lock:
+            self.calls[endpoint] += 1
+            if not self.rate:
+                return 0
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            self.throttled += 1
+            return (1 - self.tokens) / self.rate
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body=None):
+        content = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def handle_request(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        endpoint = "{} {}".format(method, self.endpoint(self.path.split("?")[0]))
+        retry_after = self.server.admit(endpoint)
+        time.sleep(self.server.latency)
+        if retry_after:
+            self.send_response(429)
+            self.send_header("Retry-After", str(math.ceil(retry_after)))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.respond(method, self.path, body)
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+
+class JiraStubHandler(StubHandler):
+    """The Jira Cloud endpoints used by jira.py: bulk and single create, transitions, bulk transitions,
+    issue search and the agile board"""
+
+    def endpoint(self, path):
+        path = re.sub(r"/[A-Z][A-Z0-9]*-\d+", "/{issueKey}", path)
+        path = re.sub(r"/project/[^/]+", "/project/{projectKey}", path)
+        return re.sub(r"/(board|queue)/\d+", r"/\1/{id}", path)
+
+    def create(self, fields):
+        with self.server.lock:
+            number = self.server.state["issues"] = self.server.state.get("issues", 0) + 1
+        key = "{}-{}".format(fields["project"]["key"], number)
+        return {"id": str(10000 + number), "key": key, "self": "{}/rest/api/3/issue/{}".format(self.server.url, key)}
+
+    def respond(self, method, path, body):
+        path = path.split("?")[0]
+        if method == "POST" and path.endswith("/api/3/issue/bulk"):
+            issues = [self.create(update["fields"]) for update in body["issueUpdates"]]
+            return self.send_json(201, {"issues": issues, "errors": []})
+        if method == "POST" and path.endswith("/api/3/issue"):
+            return self.send_json(201, self.create(body["fields"]))
+        if method == "GET" and "/api/3/project/" in path:
+            return self.send_json(200, {"issueTypes": [{"id": "10001", "name": "Task"},
+                                                       {"id": "10002", "name": "Subtask"},
+                                                       {"id": "10000", "name": "Epic"}]})
+        if path.endswith("/transitions") and method == "GET":
+            return self.send_json(200, {"transitions": [{"id": "21", "name": "In Progress"},
+                                                        {"id": "31", "name": self.server.state["transition"]}]})
+        if path.endswith("/transitions") and method == "POST":
+            return self.send_json(204)
+        if method == "POST" and path.endswith("/api/3/bulk/issues/transition"):
+            return self.send_json(201, {"taskId": "1"})
+        if method == "GET" and "/api/3/bulk/queue/" in path:
+            return self.send_json(200, {"status": "COMPLETE", "progressPercent": 100, "failedAccessibleIssues": {}})
+        if method == "GET" and "/api/3/search/jql" in path:
+            return self.send_json(200, {"issues": []})
+        if method == "POST" and "/agile/1.0/board/" in path:
+            return self.send_json(204)
+        self.send_json(404, {"errorMessages": ["No stub for {} {}".format(method, path)]})
+
+
+class DocsStubHandler(StubHandler):
+    """Best practice pages with the "established:" paragraph, the risk level is derived from the choice ID"""
+
+    def endpoint(self, path):
+        return re.sub(r"/[^/]+\.html$", "/{page}.html", path)
+
+    def respond(self, method, path, body):
+        choice_id = os.path.splitext(os.path.basename(path))[0]
+        risk_level = page_risk_level(choice_id)
+        filler = "<p>Lorem ipsum <a href=\"#\">dolor</a> sit amet, consectetur adipiscing elit.</p>\n"
+        padding = filler * (self.server.state["page_size"] // len(filler))
+        half = len(padding) // 2
+        content = ("<html><head><title>{}</title></head><body><div id=\"main\">{}"
+                   "<p><b>Level of risk exposed if this best practice is not established:</b> {}</p>"
+                   "{}</div></body></html>").format(choice_id, padding[:half], risk_level, padding[half:]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def page_risk_level(choice_id):
+    return PAGE_RISK_LEVELS[zlib.crc32(choice_id.encode()) % len(PAGE_RISK_LEVELS)]
+
+
+class StubWAClient:
+    """Serves list_answers of a synthetic workload, in pages like the Well-Architected API"""
+
+    PAGE_SIZE = 10
+
+    def __init__(self, questions, choices, selected_ratio, seed, latency=0):
+        self.latency = latency
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        generator = random.Random(seed)
+        self.answers = {}
+        for pillar in PILLARS:
+            answers = []
+            for question in range(questions):
+                question_id = "{}_question_{}".format(pillar, question)
+                choices_list = [{"ChoiceId": "{}_choice_{}".format(question_id, choice),
+                                 "Title": "Best practice {} of {}".format(choice, question_id)}
+                                for choice in range(choices)]
+                choices_list.append({"ChoiceId": "{}_no".format(question_id), "Title": "None of these"})
+                answers.append({"QuestionId": question_id,
+                                "PillarId": pillar,
+                                "QuestionTitle": "Question {} of {}".format(question, pillar),
+                                "Choices": choices_list,
+                                "SelectedChoices": [choice["ChoiceId"] for choice in choices_list[:-1]
+                                                    if generator.random() < selected_ratio],
+                                "ChoiceAnswerSummaries": [],
+                                "Risk": generator.choice(ANSWER_RISKS)})
+            self.answers[pillar] = answers
+
+    def list_answers(self, WorkloadId, LensAlias, PillarId, NextToken=None, **kwargs):
+        with self.lock:
+            self.calls["list_answers"] += 1
+        time.sleep(self.latency)
+        start = int(NextToken or 0)
+        answers = self.answers.get(PillarId, [])
+        response = {"WorkloadId": WorkloadId, "LensAlias": LensAlias,
+                    "AnswerSummaries": json.loads(json.dumps(answers[start:start + self.PAGE_SIZE]))}
+        if start + self.PAGE_SIZE < len(answers):
+            response["NextToken"] = str(start + self.PAGE_SIZE)
+        return response
+
+
+def run_benchmark(arguments, wafr_arguments):
+    jira_stub = StubServer(JiraStubHandler, arguments.stubJiraLatency, arguments.stubJiraRateLimit).start()
+    docs_stub = StubServer(DocsStubHandler, arguments.stubDocLatency, arguments.stubDocRateLimit).start()
+    docs_stub.state["page_size"] = arguments.pageSize * 1024
+    for variable in ["AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "AWS_SESSION_TOKEN", "JIRA_TOKEN", "JIRA_EMAIL"]:
+        os.environ.setdefault(variable, "benchmark")
+    import jira
+    import parseAwsDocWebPages
+    from metrics import metrics
+    import parseWAFR
+    from answerSnapshot import load_snapshot, SnapshotClient
+    from syncState import SyncState
+    from runJournal import RunJournal
+    parseWAFR.configure(parseWAFR.parse_arguments(["-w", BENCHMARK_WORKLOAD, "-j", BENCHMARK_PROJECT,
+                                                   "-e", BENCHMARK_EPIC, "-b", BENCHMARK_BOARD,
+                                                   "--docCacheDir", "",
+                                                   "--stateFile", BENCHMARK_STATE_FILE,
+                                                   "--journalFile", BENCHMARK_JOURNAL_FILE] + wafr_arguments))
+    parseWAFR.read_credentials()
+    parseWAFR.setup_logging(arguments.debug)
+    if not arguments.debug:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    jira_stub.state["transition"] = parseWAFR.JIRA_WAS_DONE_TRANSITION_NAME
+    jira.configure_base_url("{}/rest".format(jira_stub.url))
+    jira.configure_scheduler(parseWAFR.JIRA_RATE_LIMIT, parseWAFR.JIRA_MAX_RETRIES)
+    jira.configure_timeout(parseWAFR.JIRA_CONNECT_TIMEOUT, parseWAFR.JIRA_READ_TIMEOUT)
+    parseAwsDocWebPages.DOC_URL_TEMPLATE = docs_stub.url + "/wellarchitected/{}/framework/{}.html"
+    parseAwsDocWebPages.configure_page_cache("")
+    parseAwsDocWebPages.configure_rate_limit(parseWAFR.DOC_RATE_LIMIT)
+    if parseWAFR.FROM_SNAPSHOT:
+        snapshot = load_snapshot(parseWAFR.FROM_SNAPSHOT)
+        waclient = SnapshotClient(snapshot)
+        workload_id = snapshot["workloadId"]
+        answers = [answer for answers in snapshot["answers"].values() for answer in answers]
+        workload = {"snapshot": parseWAFR.FROM_SNAPSHOT, "pillars": len(snapshot["answers"]),
+                    "questions": len(answers), "choices": sum(len(answer["Choices"]) for answer in answers)}
+    else:
+        waclient = StubWAClient(arguments.questions, arguments.choices, arguments.selectedRatio, arguments.seed,
+                                arguments.stubWaLatency)
+        workload_id = BENCHMARK_WORKLOAD
+        workload = {"pillars": len(PILLARS), "questions": arguments.questions, "choices": arguments.choices}
+
+    # --sync, --stateFile, --journalFile and --resume apply as in parseWAFR.py, the files default to BENCHMARK_DIR
+    os.makedirs(BENCHMARK_DIR, exist_ok=True)
+    state = SyncState(parseWAFR.STATE_FILE) if parseWAFR.SYNC else None
+    journal = None
+    if parseWAFR.RESUME or parseWAFR.JOURNAL_FILE != BENCHMARK_JOURNAL_FILE:
+        journal = RunJournal(parseWAFR.JOURNAL_FILE, parseWAFR.RESUME)
+        journal.start(workloadId=workload_id,
+                      project=BENCHMARK_PROJECT,
+                      epic=BENCHMARK_EPIC,
+                      lensVersion=parseWAFR.LENS_VERSION)
+
+    metrics.reset()
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        summary = parseWAFR.create_tasks(waclient,
+                                         workload_id,
+                                         parseWAFR.LENS_ALIAS,
+                                         BENCHMARK_PROJECT,
+                                         BENCHMARK_EPIC,
+                                         BENCHMARK_BOARD,
+                                         state=state,
+                                         journal=journal)
+    finally:
+        if journal is not None:
+            journal.close()
+    wall_time = time.perf_counter() - started
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    jira_stub.shutdown()
+    docs_stub.shutdown()
+
+    jira_requests = sum(jira_stub.calls.values())
+    doc_requests = sum(docs_stub.calls.values())
+    return {
+        "workload": workload,
+        "summary": summary,
+        "wallTime": wall_time,
+        "peakMemory": peak_memory,
+        "jira": {"requests": jira_requests, "requestsPerSecond": jira_requests / wall_time,
+                 "throttled": jira_stub.throttled, "endpoints": dict(jira_stub.calls)},
+        "docs": {"requests": doc_requests, "requestsPerSecond": doc_requests / wall_time,
+                 "throttled": docs_stub.throttled, "endpoints": dict(docs_stub.calls)},
+        "wa": {"requests": sum(getattr(waclient, "calls", {}).values()), "endpoints": dict(getattr(waclient, "calls", {}))},
+        "metrics": metrics.as_dict(),
+        "metricsTable": metrics.summary_table()
+    }
+
+def print_results(results):
+    workload = results["workload"]
+    summary = results["summary"]
+    if "snapshot" in workload:
+        print("Workload: snapshot {}, {} pillars, {} questions, {} choices".format(workload["snapshot"],
+                                                                                  workload["pillars"],
+                                                                                  workload["questions"],
+                                                                                  workload["choices"]))
+    else:
+        print("Workload: {} pillars x {} questions x {} choices".format(workload["pillars"], workload["questions"],
+                                                                       workload["choices"]))
+    print("Created {} tasks and {} subtasks, {} transitions, {} moved to board, {} failed writes".format(
+        summary["tasks"], summary["subtasks"], summary["transitions"], summary["moved"], summary["failed"]))
+    print("Wall time: {:.2f} s".format(results["wallTime"]))
+    print("Peak memory: {:.1f} MB".format(results["peakMemory"] / 1024 / 1024))
+    for name in ["jira", "docs", "wa"]:
+        service = results[name]
+        line = "{}: {} requests".format(name, service["requests"])
+        if "requestsPerSecond" in service:
+            line += ", {:.1f} requests/s, {} throttled".format(service["requestsPerSecond"], service["throttled"])
+        print(line)
+        for endpoint, count in sorted(service["endpoints"].items(), key=lambda item: -item[1]):
+            print("    {:>6}  {}".format(count, endpoint))
+    print("Client side:")
+    print(results["metricsTable"])
+
+def main():
+    arguments, wafr_arguments = PARSER.parse_known_args()
+    results = run_benchmark(arguments, wafr_arguments)
+    print_results(results)
+    if arguments.outputFile:
+        with open(arguments.outputFile, "w") as f:
+            json.dump(results, f, indent=1)
+
+if __name__ == "__main__":
+    main()
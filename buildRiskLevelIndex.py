@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import datetime
+import logging
+import re
+
+import argparse
+from parseAwsDocWebPages import get, choice_page_url, resolve_risk_levels, configure_rate_limit, DEFAULT_WORKERS
+from riskLevelMap import CHOICE_ID_RISK_LEVEL_MAP, RISK_LEVEL_INDEX_DIR, save_risk_level_index
+
+logger = logging.getLogger()
+
+# Question pages are named <code>-<NN>.html and link to the pages of their choices, <code>_*.html
+PILLAR_CODES = ["ops", "sec", "rel", "perf", "cost", "sus"]
+
+PARSER = argparse.ArgumentParser(
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+    description='Builds the choice_id -> risk level index parseWAFR.py looks risk levels up in'
+    )
+
+PARSER.add_argument('-l','--lensVersion', required=False, action='append', help='Lense version to build the index for, can be repeated (default: latest)')
+PARSER.add_argument('-d','--indexDir', required=False, default=RISK_LEVEL_INDEX_DIR, help='Directory to write <lensVersion>.json index files to')
+PARSER.add_argument('--docWorkers', required=False, type=int, default=DEFAULT_WORKERS, help='Number of documentation pages fetched in parallel')
+PARSER.add_argument('--docRateLimit', required=False, type=float, default=0, help='Max documentation requests per second, 0 means no limit')
+PARSER.add_argument('--fromBuiltinMap', action='store_true', help='Write the latest index from the risk levels built into riskLevelMap.py, no page is fetched')
+
+
+def get_question_choice_ids(lens_version, code, index):
+    url = choice_page_url(lens_version, "{}-{:02d}".format(code, index))
+    response = get(url)
+    if response.status_code != 200:
+        return None
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(response.content, "html.parser")
+    choice_ids = []
+    for a in soup.find_all('a', href=True):
+        match = re.match(r"^(?:\./)?({}_\w+)\.html$".format(code), a["href"])
+        if match and match.group(1) not in choice_ids:
+            choice_ids.append(match.group(1))
+    return choice_ids
+
+def get_lens_choice_ids(lens_version):
+    choice_ids = []
+    for code in PILLAR_CODES:
+        index = 1
+        while True:
+            question_choice_ids = get_question_choice_ids(lens_version, code, index)
+            if question_choice_ids is None:
+                break
+            logger.info("%s-%02d: %s choices" % (code, index, len(question_choice_ids)))
+            choice_ids.extend(question_choice_ids)
+            index += 1
+    return choice_ids
+
+def build_risk_level_index(lens_version, index_dir, workers):
+    choice_ids = get_lens_choice_ids(lens_version)
+    risk_level_map = resolve_risk_levels(choice_ids, lens_version, workers)
+    unresolved = [choice_id for choice_id, risk_level in risk_level_map.items() if risk_level is None]
+    for choice_id in unresolved:
+        logger.error("Could not find risk level for %s, leaving it out of the index" % choice_id)
+        del risk_level_map[choice_id]
+    if lens_version == "latest":
+        for choice_id, expected in CHOICE_ID_RISK_LEVEL_MAP.items():
+            if choice_id in risk_level_map and risk_level_map[choice_id] != expected:
+                logger.warning("%s: detected %s, expected %s" % (choice_id, risk_level_map[choice_id], expected))
+    save_index(lens_version, risk_level_map, index_dir)
+
+def save_index(lens_version, risk_level_map, index_dir):
+    generated_at = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+    path = save_risk_level_index(lens_version, risk_level_map, generated_at, index_dir)
+    logger.info("Saved %s risk levels of lens version %s to %s" % (len(risk_level_map), lens_version, path))
+
+def main():
+    """ Main program run """
+    arguments = PARSER.parse_args()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s.%(msecs)03d %(levelname)s %(module)s - %(funcName)s: %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+    )
+    if arguments.fromBuiltinMap:
+        save_index("latest", CHOICE_ID_RISK_LEVEL_MAP, arguments.indexDir)
+        return
+    configure_rate_limit(arguments.docRateLimit)
+    for lens_version in arguments.lensVersion or ["latest"]:
+        build_risk_level_index(lens_version, arguments.indexDir, arguments.docWorkers)
+
+
+if __name__ == "__main__":
+    main()
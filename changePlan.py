@@ -0,0 +1,34 @@
+import json
+from datetime import datetime, timezone
+
+PLAN_VERSION = 1
+
+
+def new_plan(lens_version):
+    """Empty change plan: the Jira issues, transitions and board moves planned for each workload"""
+    return {"version": PLAN_VERSION,
+            "createdAt": datetime.now(timezone.utc).isoformat(),
+            "lensVersion": lens_version,
+            "workloads": []}
+
+def save_plan(path, plan):
+    with open(path, "w") as f:
+        json.dump(plan, f, indent=1)
+
+def load_plan(path):
+    with open(path) as f:
+        plan = json.load(f)
+    if plan.get("version") != PLAN_VERSION:
+        raise ValueError("Plan {} has version {}, only version {} is supported".format(path,
+                                                                                     plan.get("version"),
+                                                                                     PLAN_VERSION))
+    return plan
+
+def plan_counts(workload_plan):
+    """Number of issues to create, transitions and board moves in the plan of a workload"""
+    tasks = workload_plan["tasks"]
+    subtasks = [subtask for task in tasks for subtask in task["subtasks"]]
+    return {"tasks": len([task for task in tasks if task["key"] is None]),
+            "subtasks": len([subtask for subtask in subtasks if subtask["key"] is None]),
+            "transitions": len([issue for issue in tasks + subtasks if issue["transit"]]),
+            "moves": len([task for task in tasks if task["moveToBoard"]])}
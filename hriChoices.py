@@ -0,0 +1,54 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class HriTable:
+    """HRI choices of a set of answers: one row per applicable choice with a High risk level
+
+    A row is {"QuestionId", "ChoiceId", "Title", "Selected", "Documention"}, rows are indexed by QuestionId.
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.by_question = {}
+
+    def add(self, row):
+        self.rows.append(row)
+        self.by_question.setdefault(row["QuestionId"], []).append(row)
+
+    def question(self, question_id):
+        return self.by_question.get(question_id, [])
+
+    def counts(self):
+        return {"questions": len(self.by_question),
+                "choices": len(self.rows),
+                "selected": len([row for row in self.rows if row["Selected"]])}
+
+
+def evaluate_hri_choices(answers, risk_level_map, choice_url):
+    """Finds the HRI choices of all `answers` in one pass over their choices
+
+    A choice is an HRI when its risk level is High and it is not marked NOT_APPLICABLE in the
+    ChoiceAnswerSummaries of its answer. `choice_url` gives the documentation page of a choice ID.
+    """
+    table = HriTable()
+    for answer in answers:
+        not_applicable = {summary["ChoiceId"] for summary in answer["ChoiceAnswerSummaries"]
+                          if summary["Status"] == "NOT_APPLICABLE"}
+        selected = set(answer["SelectedChoices"])
+        for choice in answer["Choices"]:
+            if choice["Title"] == "None of these":
+                continue
+            choice_id = choice["ChoiceId"]
+            risk_level = risk_level_map.get(choice_id)
+            if risk_level is None:
+                logger.error("Could not find risk level on page: %s" % choice_url(choice_id))
+                continue
+            if risk_level == "High" and choice_id not in not_applicable:
+                table.add({"QuestionId": answer["QuestionId"],
+                           "ChoiceId": choice_id,
+                           "Title": choice["Title"],
+                           "Selected": choice_id in selected,
+                           "Documention": choice_url(choice_id)})
+    return table
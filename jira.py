@@ -1,9 +1,16 @@
-# it'd be better to implement object-orientated approach, and create auth object and issue_name_to_id map in the init method
-
-import requests
-from requests.auth import HTTPBasicAuth
+import email.utils
 import json
+import logging
+import os
+import random
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from metrics import metrics
 # import os
 # import sys
 # import argparse
@@ -56,44 +63,187 @@ boards_url = "{}{}".format(base_url, boards_path)
 #     print("Unexpected error:", sys.exc_info()[0])
 #     raise
 
+logger = logging.getLogger(__name__)
+
 headers = {
   "Accept": "application/json",
   "Content-Type": "application/json"
 }
 
-def unify_issue_name(name: str):
-    return re.sub('[^A-Za-z0-9]+', '', name).upper()
+# Connection pool size for the shared session, enough for the worker threads of a single run
+DEFAULT_POOL_SIZE = 10
+# Jira accepts at most 50 issues in one /issue/bulk request
+BULK_CREATE_LIMIT = 50
+# Jira metadata (issue types, transitions) rarely changes, keep it on disk for a day by default
+DEFAULT_METADATA_CACHE_TTL = 24 * 60 * 60
+# Starting request rate, adjusted at runtime between MIN_RATE and the configured maximum
+DEFAULT_RATE = 10.0
+MIN_RATE = 0.5
+DEFAULT_MAX_RETRIES = 5
+# (connect, read) seconds, a stalled connection fails and is retried instead of blocking its thread for good
+DEFAULT_TIMEOUT = (10, 60)
+MAX_BACKOFF = 60
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE")
+# Jira transits at most 1000 issues in one bulk request, and reports the outcome through an asynchronous task
+BULK_TRANSITION_LIMIT = 1000
+BULK_TASK_POLL_INTERVAL = 1
+BULK_TASK_TIMEOUT = 300
+# Issues looked up by key in one search request
+SEARCH_PAGE_SIZE = 100
+# Jira Software moves at most 50 issues to a board in one request, batches are sent this many at a time
+BOARD_MOVE_LIMIT = 50
+DEFAULT_BOARD_MOVE_WORKERS = 4
+# A create whose response was lost is found again by the label of its run and the ref in its entity property
+DEDUP_LABEL_PREFIX = "wa2jira-run-"
+DEDUP_PROPERTY_KEY = "wa2jira"
+# issue search is eventually consistent, an issue created seconds ago may not be found at the first try
+DEDUP_LOOKUP_ATTEMPTS = 3
+DEDUP_LOOKUP_DELAY = 2
 
-def get_issue_type_id(auth, project_id, issue_type):
-    issue_types_url =  "https://devops-workspace.atlassian.net/rest/api/3/project/{}".format(project_id)
-    response = requests.request(
-        "GET",
-        issue_types_url,
-        headers=headers,
-        auth=auth
-    )
-    issue_types = {}
-    # print(json.loads(response.text))
-    for it in json.loads(response.text)["issueTypes"]:
-        # issue_types[it["name"]] = it["id"]
-        issue_types[unify_issue_name(it["name"])] = it["id"]
-    return issue_types[unify_issue_name(issue_type)]
-
-# def get_transition_id():
 
-def create_issue(
-        email_address,
-        api_token,
-        issue_type,
-        pillar_label,
-        parent,
-        proj_key,
-        summary,
-        link
-):
+class MetadataCache:
+    """Small JSON file with expiring entries shared by all runs against the same Jira projects"""
+
+    def __init__(self, path, ttl=DEFAULT_METADATA_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry["stored_at"] > self.ttl:
+                del self.entries[key]
+                return None
+            return entry["value"]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = {"value": value, "stored_at": time.time()}
+            self._save()
+
+    def invalidate(self, key):
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self._save()
+
+    def _save(self):
+        tmp_path = "{}.tmp".format(self.path)
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
 
-    auth = HTTPBasicAuth(email_address, api_token)
-    payload = json.dumps( {
+
+class RequestScheduler:
+    """Token bucket in front of every Jira request, with the rate adapted to how Jira throttles us
+
+    The rate halves on every 429 and creeps back up to `max_rate` on successful responses. Retry-After and
+    an exhausted X-RateLimit-Remaining pause all requests until Jira is ready to take them again.
+    """
+
+    def __init__(self, max_rate=DEFAULT_RATE, max_retries=DEFAULT_MAX_RETRIES):
+        self.max_rate = max_rate
+        self.rate = max_rate
+        self.max_retries = max_retries
+        self.lock = threading.Lock()
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.retries = 0
+        self.throttled = 0
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(max(self.rate, 1.0), self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait = max(self.paused_until - now, (1.0 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def on_response(self, response):
+        with self.lock:
+            if response.status_code == 429:
+                self.throttled += 1
+                self.rate = max(MIN_RATE, self.rate / 2)
+            elif response.status_code < 400:
+                self.rate = min(self.max_rate, self.rate + 0.1)
+            pause = None
+            if response.status_code in (429, 503):
+                pause = parse_retry_after(response.headers.get("Retry-After"))
+            if response.headers.get("X-RateLimit-Remaining") == "0":
+                reset = parse_rate_limit_reset(response.headers.get("X-RateLimit-Reset"))
+                if reset is not None:
+                    pause = max(pause or 0, reset)
+            if pause:
+                self.paused_until = max(self.paused_until, time.monotonic() + min(pause, MAX_BACKOFF))
+
+    def backoff(self, attempt, response=None):
+        with self.lock:
+            self.retries += 1
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return min(retry_after, MAX_BACKOFF)
+        return min(2 ** attempt + random.random(), MAX_BACKOFF)
+
+    def stats(self):
+        return {"rate": round(self.rate, 2), "retries": self.retries, "throttled": self.throttled}
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+def parse_rate_limit_reset(value):
+    # Jira sends the reset time as ISO 8601 timestamp
+    if not value:
+        return None
+    try:
+        reset = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if reset.tzinfo is None:
+        reset = reset.replace(tzinfo=timezone.utc)
+    return max(reset.timestamp() - time.time(), 0)
+
+def dedup_label(run_id):
+    # one label per run, so that the issues of an earlier run with the same refs are never taken for this run's
+    return "{}{}".format(DEDUP_LABEL_PREFIX, run_id[:12])
+
+def endpoint_name(base, method, url):
+    # issue keys and IDs are replaced, so that all requests to the same REST resource are counted together
+    path = url[len(base):] if url.startswith(base) else url
+    path = re.sub(r"/[A-Z][A-Z0-9_]*-\d+", "/{issueKey}", path.split("?")[0])
+    path = re.sub(r"/(project|board|queue)/[^/]+", r"/\1/{id}", path)
+    return "{} {}".format(method, path)
+
+def issue_payload(issue_type_id, pillar_label, parent, proj_key, summary, link, ref=None, run_id=None):
+    labels = [pillar_label]
+    if ref is not None and run_id is not None:
+        labels.append(dedup_label(run_id))
+    payload = {
         "fields": {
             "description": {
             "version": 1,
@@ -119,11 +269,9 @@ def create_issue(
             ]
             },
             "issuetype": {
-            "id": get_issue_type_id(auth, proj_key, issue_type)
+            "id": issue_type_id
             },
-            "labels": [
-            pillar_label
-            ],
+            "labels": labels,
             "parent": {
             "key": parent
             },
@@ -133,49 +281,13 @@ def create_issue(
             "summary": summary.replace("\n", ""),
         },
         "update": {}
-    } )
-
-    response = requests.request(
-        "POST",
-        issues_url,
-        data=payload,
-        headers=headers,
-        auth=auth
-    )
+    }
+    if ref is not None and run_id is not None:
+        payload["properties"] = [{"key": DEDUP_PROPERTY_KEY, "value": {"runId": run_id, "ref": ref}}]
+    return payload
 
-    # print(json.dumps(json.loads(response.text), sort_keys=True, indent=4, separators=(",", ": ")))
-    return json.loads(response.text)["key"]
-
-def get_transition_id_by_name(
-        email_address,
-        api_token,
-        issue_key,
-        transition_name  
-):
-    url = "{}/{}/transitions".format(issues_url, issue_key)
-    auth = HTTPBasicAuth(email_address, api_token)
-    response = requests.request(
-        "GET",
-        url,
-        headers=headers,
-        auth=auth
-    )
-    for tr in json.loads(response.text)["transitions"]:
-        if tr["name"].upper() == transition_name.upper():
-            return tr["id"]
-    return None
-
-def transit_issue(
-        email_address,
-        api_token,
-        issue_key,
-        transition_id
-):
-
-    url = "{}/{}/transitions".format(issues_url, issue_key)
-    auth = HTTPBasicAuth(email_address, api_token)
-
-    payload = json.dumps( {
+def transition_payload(transition_id):
+    return json.dumps( {
         "transition": {
             "id": transition_id
         },
@@ -204,16 +316,630 @@ def transit_issue(
         }
     } )
 
-    response = requests.request(
-        "POST",
-        url,
-        data=payload,
-        headers=headers,
-        auth=auth
-    )
 
-    #print(json.dumps(json.loads(response.text), sort_keys=True, indent=4, separators=(",", ": ")))
-    return response.status_code
+class JiraClient:
+    """Keeps one keep-alive session (pooled connections, auth and headers) for all Jira calls of a run"""
+
+    def __init__(self, email_address, api_token, base_url=base_url, pool_size=DEFAULT_POOL_SIZE, metadata_cache=None,
+                 scheduler=None, timeout=DEFAULT_TIMEOUT):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.scheduler = scheduler or RequestScheduler()
+        self.metadata_cache = metadata_cache
+        self.issue_types = {}
+        self.issue_types_lock = threading.Lock()
+        self.issue_type_cache_hits = 0
+        self.issue_type_cache_misses = 0
+        self.issue_keys_by_id = {}
+        self.transition_ids = {}
+        self.transition_ids_lock = threading.Lock()
+        self.transition_cache_hits = 0
+        self.transition_cache_misses = 0
+        self.issues_url = "{}{}".format(base_url, issues_path)
+        self.boards_url = "{}{}".format(base_url, boards_path)
+        # the HTTP stack is loaded with the first client, so that importing this module stays cheap
+        import requests
+        from requests.adapters import HTTPAdapter
+        from requests.auth import HTTPBasicAuth
+        self.connection_errors = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+        self.session = requests.Session()
+        self.session.auth = HTTPBasicAuth(email_address, api_token)
+        self.session.headers.update(headers)
+        self.adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+    def request(self, method, url, payload=None, idempotent=None):
+        # 429 means Jira did not process the request, so it is retried whatever the method is;
+        # 5xx and connection errors are retried only for requests that are safe to send twice
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        attempt = 0
+        endpoint = self.endpoint_name(method, url)
+        while True:
+            self.scheduler.acquire()
+            started = time.monotonic()
+            try:
+                response = self.session.request(
+                    method,
+                    url,
+                    data=payload,
+                    timeout=self.timeout
+                )
+            except self.connection_errors as e:
+                metrics.observe("jira", endpoint, time.monotonic() - started, error=True, retries=min(attempt, 1),
+                                bytes_sent=len(payload or ""))
+                if not idempotent or attempt >= self.scheduler.max_retries:
+                    raise
+                delay = self.scheduler.backoff(attempt)
+                logger.warning("%s %s failed (%s), retrying in %.1fs" % (method, url, e, delay))
+            else:
+                metrics.observe("jira", endpoint, time.monotonic() - started, error=response.status_code >= 400,
+                                retries=min(attempt, 1), bytes_sent=len(payload or ""),
+                                bytes_received=len(response.content))
+                self.scheduler.on_response(response)
+                retry = response.status_code == 429 or (idempotent and response.status_code in RETRY_STATUS_CODES)
+                if not retry or attempt >= self.scheduler.max_retries:
+                    return response
+                delay = self.scheduler.backoff(attempt, response)
+                logger.warning("%s %s: status code is %s, retrying in %.1fs" % (method, url, response.status_code, delay))
+            time.sleep(delay)
+            attempt += 1
+
+    def endpoint_name(self, method, url):
+        return endpoint_name(self.base_url, method, url)
+
+    def connection_stats(self):
+        # urllib3 pools count every connection they open and every request they send
+        opened = 0
+        sent = 0
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            opened += pool.num_connections
+            sent += pool.num_requests
+        return {"requests": sent, "opened": opened, "reused": max(sent - opened, 0)}
+
+    def close(self):
+        self.session.close()
+
+    def get_issue_types(self, project_id):
+        # filled once per project: memory first, then the on-disk cache, then Jira
+        with self.issue_types_lock:
+            issue_types = self.issue_types.get(project_id)
+            if issue_types is None and self.metadata_cache is not None:
+                issue_types = self.metadata_cache.get("issuetypes|{}|{}".format(self.base_url, project_id))
+            if issue_types is not None:
+                self.issue_type_cache_hits += 1
+                metrics.count("jira", "issue_type_cache_hits")
+            else:
+                self.issue_type_cache_misses += 1
+                metrics.count("jira", "issue_type_cache_misses")
+                issue_types_url = "{}/api/3/project/{}".format(self.base_url, project_id)
+                response = self.request("GET", issue_types_url)
+                issue_types = {}
+                for it in json.loads(response.text)["issueTypes"]:
+                    issue_types[unify_issue_name(it["name"])] = it["id"]
+                if self.metadata_cache is not None:
+                    self.metadata_cache.set("issuetypes|{}|{}".format(self.base_url, project_id), issue_types)
+            self.issue_types[project_id] = issue_types
+            return issue_types
+
+    def get_issue_type_id(self, project_id, issue_type):
+        return self.get_issue_types(project_id)[unify_issue_name(issue_type)]
+
+    def issue_type_cache_stats(self):
+        return {"hits": self.issue_type_cache_hits, "misses": self.issue_type_cache_misses}
+
+    def build_issue(self, issue_type, pillar_label, parent, proj_key, summary, link, ref=None, run_id=None):
+        return issue_payload(self.get_issue_type_id(proj_key, issue_type), pillar_label, parent, proj_key, summary,
+                             link, ref, run_id)
+
+    def create_issue(self, issue_type, pillar_label, parent, proj_key, summary, link, ref=None):
+        return self.create_issues([{"issue_type": issue_type,
+                                    "pillar_label": pillar_label,
+                                    "parent": parent,
+                                    "proj_key": proj_key,
+                                    "summary": summary,
+                                    "link": link,
+                                    "ref": ref}])[0]
+
+    def create_issues(self, issues: list, run_id=None, run_started=None):
+        """Creates issues with as few /issue/bulk requests as possible
+
+        Every item of `issues` is a dict with create_issue arguments. Returns the created keys in the same
+        order, with None in place of the items Jira rejected, so one bad payload does not fail the others.
+        With a `run_id`, items with a `ref` get the label of the run and both in the DEDUP_PROPERTY_KEY entity
+        property, so that a batch whose outcome is unknown (5xx, lost connection) is resent only for the issues
+        Jira did not create. The lookup is limited to the issues of the project created since `run_started`
+        (epoch seconds).
+        """
+        keys = []
+        for start in range(0, len(issues), BULK_CREATE_LIMIT):
+            keys.extend(self.create_issue_batch(issues[start:start + BULK_CREATE_LIMIT], run_id, run_started))
+        return keys
+
+    def create_issue_batch(self, batch: list, run_id=None, run_started=None):
+        keys = [None] * len(batch)
+        pending = list(range(len(batch)))
+        url = "{}/bulk".format(self.issues_url)
+        attempt = 0
+        while True:
+            payload = json.dumps( {
+                "issueUpdates": [self.build_issue(run_id=run_id, **batch[i]) for i in pending]
+            } )
+            response = None
+            try:
+                response = self.request("POST", url, payload, idempotent=False)
+            except self.connection_errors as e:
+                logger.warning("Bulk creation of %s issues failed: %s" % (len(pending), e))
+            if response is not None and response.status_code < 500:
+                self.read_bulk_response(response, [batch[i] for i in pending], pending, keys)
+                return keys
+            dedup = run_id is not None and all(batch[i].get("ref") is not None for i in pending)
+            if dedup:
+                # Jira may have created some of them before failing: look them up before sending the rest again,
+                # and after the last attempt too, so that the caller gets the keys of all that exist
+                found = self.find_created_issues([batch[i] for i in pending], run_id, run_started)
+                for i in pending:
+                    keys[i] = found.get(batch[i]["ref"])
+                pending = [i for i in pending if keys[i] is None]
+                if not pending:
+                    return keys
+            if attempt >= self.scheduler.max_retries or not dedup:
+                logger.error("Bulk creation of %s issues failed%s" % (len(pending),
+                                                                      "" if response is None else
+                                                                      " with status code {}: {}".format(
+                                                                          response.status_code, response.text)))
+                return keys
+            time.sleep(self.scheduler.backoff(attempt, response))
+            attempt += 1
+
+    def read_bulk_response(self, response, batch, positions, keys):
+        try:
+            result = json.loads(response.text)
+        except ValueError:
+            result = {}
+        if response.status_code not in (200, 201, 400) or "issues" not in result:
+            logger.error("Bulk creation of %s issues failed with status code %s: %s" % (len(batch),
+                                                                                     response.status_code,
+                                                                                     response.text))
+            return
+        failed = {}
+        for error in result.get("errors", []):
+            failed[error["failedElementNumber"]] = error
+        created = iter(result["issues"])
+        for i, issue in enumerate(batch):
+            if i in failed:
+                logger.error("Jira rejected issue `%s`: %s" % (issue["summary"],
+                                                               failed[i].get("elementErrors")))
+            else:
+                issue = next(created)
+                keys[positions[i]] = issue["key"]
+                # bulk transition results refer to issues by ID
+                self.issue_keys_by_id[str(issue["id"])] = issue["key"]
+
+    def find_issues_by_refs(self, issues: list, run_id, run_started):
+        """Returns ref -> key of the `issues` that Jira created in run `run_id`"""
+        refs = {issue["ref"] for issue in issues}
+        projects = sorted({issue["proj_key"] for issue in issues})
+        parents = sorted({issue["parent"] for issue in issues})
+        # a relative date does not depend on the time zone of the Jira user, a minute of margin for clock skew
+        minutes = int((time.time() - (run_started or time.time())) / 60) + 2
+        query = {
+            "jql": "project in ({}) AND parent in ({}) AND labels = {} AND created >= -{}m".format(
+                ", ".join(projects), ", ".join(parents), dedup_label(run_id), minutes),
+            "fields": "key",
+            "properties": DEDUP_PROPERTY_KEY,
+            "maxResults": SEARCH_PAGE_SIZE
+        }
+        found = {}
+        while True:
+            response = self.request("GET", "{}/api/3/search/jql?{}".format(self.base_url, urlencode(query)))
+            if response.status_code != 200:
+                logger.error("Could not look up issues by dedup label: status code is %s" % response.status_code)
+                return found
+            result = json.loads(response.text)
+            for issue in result["issues"]:
+                dedup = issue.get("properties", {}).get(DEDUP_PROPERTY_KEY) or {}
+                if dedup.get("runId") == run_id and dedup.get("ref") in refs:
+                    found[dedup["ref"]] = issue["key"]
+            if result.get("isLast", True) or not result.get("nextPageToken"):
+                return found
+            query["nextPageToken"] = result["nextPageToken"]
+
+    def find_created_issues(self, issues: list, run_id, run_started):
+        # search results lag behind creates: look again a few times before taking an issue as not created
+        found = {}
+        for attempt in range(DEDUP_LOOKUP_ATTEMPTS):
+            if attempt:
+                time.sleep(DEDUP_LOOKUP_DELAY)
+            found.update(self.find_issues_by_refs([issue for issue in issues if issue["ref"] not in found],
+                                                  run_id, run_started))
+            if len(found) == len(issues):
+                break
+        return found
+
+    def get_transition_id_by_name(self, issue_key, transition_name):
+        url = "{}/{}/transitions".format(self.issues_url, issue_key)
+        response = self.request("GET", url)
+        for tr in json.loads(response.text)["transitions"]:
+            if tr["name"].upper() == transition_name.upper():
+                return tr["id"]
+        return None
+
+    def transition_cache_key(self, project_id, issue_type, transition_name):
+        return "transition|{}|{}|{}|{}".format(self.base_url, project_id, unify_issue_name(issue_type),
+                                               transition_name.upper())
+
+    def get_transition_id(self, project_id, issue_type, transition_name, issue_key):
+        """Transition ID by name for issues of `issue_type` in `project_id`, looked up on `issue_key` only on a miss
+
+        Issue types of a project can use different workflows, so the ID is cached per project and issue type,
+        in memory for the process and in the metadata cache (if configured) for the next runs.
+        """
+        key = self.transition_cache_key(project_id, issue_type, transition_name)
+        with self.transition_ids_lock:
+            transition_id = self.transition_ids.get(key)
+            if transition_id is None and self.metadata_cache is not None:
+                transition_id = self.metadata_cache.get(key)
+            if transition_id is not None:
+                self.transition_cache_hits += 1
+                metrics.count("jira", "transition_cache_hits")
+            else:
+                self.transition_cache_misses += 1
+                metrics.count("jira", "transition_cache_misses")
+                transition_id = self.get_transition_id_by_name(issue_key, transition_name)
+                if transition_id is not None and self.metadata_cache is not None:
+                    self.metadata_cache.set(key, transition_id)
+            if transition_id is not None:
+                self.transition_ids[key] = transition_id
+            return transition_id
+
+    def invalidate_transition_id(self, project_id, issue_type, transition_name):
+        key = self.transition_cache_key(project_id, issue_type, transition_name)
+        with self.transition_ids_lock:
+            self.transition_ids.pop(key, None)
+            if self.metadata_cache is not None:
+                self.metadata_cache.invalidate(key)
+
+    def transition_cache_stats(self):
+        return {"hits": self.transition_cache_hits, "misses": self.transition_cache_misses}
+
+    def transit_issue(self, issue_key, transition_id):
+        url = "{}/{}/transitions".format(self.issues_url, issue_key)
+        payload = transition_payload(transition_id)
+        # not resent after a 5xx or a lost connection: a transition that was applied would fail the second time
+        # and leave one more comment, only throttled requests (429) are retried
+        response = self.request("POST", url, payload, idempotent=False)
+        return response.status_code
+
+    def transit_issues(self, issue_keys: list, transition_id):
+        """Transits issues with as few bulk transition requests as possible, returns the keys that were transited
+
+        Falls back to one transit_issue call per issue where the bulk endpoint is not available.
+        """
+        transited = []
+        url = "{}/api/3/bulk/issues/transition".format(self.base_url)
+        # the outcome is reported by issue ID, every key needs its ID to be told apart
+        ids_by_key = self.resolve_issue_ids(issue_keys)
+        unknown = [key for key in issue_keys if key not in ids_by_key]
+        if unknown:
+            logger.error("Could not find the IDs of %s, not transiting them" % ", ".join(unknown))
+        issue_keys = [key for key in issue_keys if key in ids_by_key]
+        for start in range(0, len(issue_keys), BULK_TRANSITION_LIMIT):
+            batch = issue_keys[start:start + BULK_TRANSITION_LIMIT]
+            payload = json.dumps( {
+                "bulkTransitionInputs": [
+                    {
+                        "selectedIssueIdsOrKeys": batch,
+                        "transitionId": str(transition_id)
+                    }
+                ],
+                "sendBulkNotification": False
+            } )
+            # not resent after a 5xx: a second task would fail for the issues the first one transited
+            response = self.request("POST", url, payload, idempotent=False)
+            if response.status_code in (404, 405):
+                logger.warning("Bulk transition is not available, transiting %s issues one by one" % len(batch))
+                transited.extend(key for key in batch if self.transit_issue(key, transition_id) < 300)
+                continue
+            if response.status_code >= 300:
+                logger.error("Bulk transition of %s issues failed with status code %s: %s" % (len(batch),
+                                                                                           response.status_code,
+                                                                                           response.text))
+                continue
+            result = self.wait_for_bulk_task(json.loads(response.text)["taskId"])
+            if result is None:
+                continue
+            failed = {str(issue_id) for issue_id in result.get("failedAccessibleIssues", {})}
+            for issue_id, errors in result.get("failedAccessibleIssues", {}).items():
+                logger.error("Jira did not transit %s: %s" % (self.issue_keys_by_id.get(str(issue_id), issue_id), errors))
+            if "processedAccessibleIssues" in result:
+                processed = {str(issue_id) for issue_id in result["processedAccessibleIssues"]}
+                done = [key for key in batch if ids_by_key[key] in processed and ids_by_key[key] not in failed]
+            elif result.get("invalidOrInaccessibleIssueCount"):
+                # without the list of processed issues there is no telling which ones were skipped
+                done = []
+            else:
+                done = [key for key in batch if ids_by_key[key] not in failed]
+            if result.get("invalidOrInaccessibleIssueCount"):
+                logger.error("%s issues were invalid or inaccessible for bulk transition" % (
+                    result["invalidOrInaccessibleIssueCount"]))
+            if len(done) < len(batch) - len(failed):
+                logger.error("%s issues were not transited" % (len(batch) - len(failed) - len(done)))
+            transited.extend(done)
+        return transited
+
+    def resolve_issue_ids(self, issue_keys: list):
+        """Returns key -> ID of `issue_keys`, looking up by search the ones not created by this client"""
+        ids_by_key = {key: issue_id for issue_id, key in list(self.issue_keys_by_id.items())}
+        missing = [key for key in dict.fromkeys(issue_keys) if key not in ids_by_key]
+        for start in range(0, len(missing), SEARCH_PAGE_SIZE):
+            batch = missing[start:start + SEARCH_PAGE_SIZE]
+            url = "{}/api/3/search/jql?{}".format(self.base_url, urlencode({
+                "jql": "key in ({})".format(", ".join(batch)),
+                "fields": "key",
+                "maxResults": len(batch)
+            }))
+            response = self.request("GET", url)
+            if response.status_code != 200:
+                logger.error("Could not look up the IDs of %s issues: status code is %s" % (len(batch),
+                                                                                           response.status_code))
+                continue
+            for issue in json.loads(response.text)["issues"]:
+                self.issue_keys_by_id[str(issue["id"])] = issue["key"]
+                ids_by_key[issue["key"]] = str(issue["id"])
+        return {key: ids_by_key[key] for key in issue_keys if key in ids_by_key}
+
+    def wait_for_bulk_task(self, task_id):
+        url = "{}/api/3/bulk/queue/{}".format(self.base_url, task_id)
+        deadline = time.monotonic() + BULK_TASK_TIMEOUT
+        while time.monotonic() < deadline:
+            response = self.request("GET", url)
+            if response.status_code != 200:
+                logger.error("Could not get bulk task %s: status code is %s" % (task_id, response.status_code))
+                return None
+            result = json.loads(response.text)
+            if result.get("status") == "COMPLETE":
+                return result
+            if result.get("status") in ("FAILED", "CANCELLED", "DEAD"):
+                logger.error("Bulk task %s ended with status %s" % (task_id, result["status"]))
+                return None
+            time.sleep(BULK_TASK_POLL_INTERVAL)
+        logger.error("Bulk task %s did not complete in %s seconds" % (task_id, BULK_TASK_TIMEOUT))
+        return None
+
+    def move_issues_to_board(self, board_id, issues: list):
+        url = "{}/{}/issue".format(self.boards_url, board_id)
+        payload = json.dumps( {
+            "issues": issues
+        } )
+        response = self.request("POST", url, payload, idempotent=True)
+        return response.status_code
+
+    def try_move_issues_to_board(self, board_id, issues: list):
+        """Moves up to BOARD_MOVE_LIMIT issues to a board, returns the keys Jira did not move"""
+        url = "{}/{}/issue".format(self.boards_url, board_id)
+        response = self.request("POST", url, json.dumps({"issues": issues}), idempotent=True)
+        if response.status_code == 207:
+            # partly done: one entry per issue, with its own status
+            try:
+                entries = json.loads(response.text).get("entries", [])
+            except ValueError:
+                return list(issues)
+            rejected = [entry for entry in entries if entry.get("status", 200) >= 300]
+            if any(entry.get("issueKey") is None for entry in rejected):
+                # entries without a key are mapped back to the sent keys by ID
+                self.resolve_issue_ids(issues)
+            failed = []
+            for entry in rejected:
+                key = entry.get("issueKey") or self.issue_keys_by_id.get(str(entry.get("issueId")))
+                if key is None:
+                    logger.error("Jira did not move issue %s to board %s, taking the whole batch as not moved" % (
+                        entry.get("issueId"), board_id))
+                    return list(issues)
+                logger.error("Jira did not move %s to board %s: %s" % (key, board_id, entry.get("errors")))
+                failed.append(key)
+            return failed
+        if response.status_code >= 300:
+            logger.error("Moving %s issues to board %s failed with status code %s: %s" % (len(issues), board_id,
+                                                                                        response.status_code,
+                                                                                        response.text))
+            return list(issues)
+        return []
+
+
+class BoardMoveQueue:
+    """Collects the issues of a run that go to a board and moves them in batches of BOARD_MOVE_LIMIT
+
+    A batch is sent in the background as soon as it is full, `workers` batches at a time, so that adding issues
+    never waits on Jira; flush() sends the rest and waits for all of them. The issues of a batch that Jira did
+    not move are sent once more. `on_moved` is called with the keys of every batch that was moved.
+    """
+
+    def __init__(self, client, board_id, workers=DEFAULT_BOARD_MOVE_WORKERS, on_moved=None):
+        self.client = client
+        self.board_id = board_id
+        self.on_moved = on_moved
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="board-moves")
+        self.lock = threading.Lock()
+        self.pending = []
+        self.futures = []
+
+    def add(self, issue_keys):
+        with self.lock:
+            self.pending.extend(issue_keys)
+            while len(self.pending) >= BOARD_MOVE_LIMIT:
+                self.futures.append(self.executor.submit(self.move, self.pending[:BOARD_MOVE_LIMIT]))
+                del self.pending[:BOARD_MOVE_LIMIT]
+
+    def send(self, batch):
+        import requests
+        try:
+            return self.client.try_move_issues_to_board(self.board_id, batch)
+        except requests.exceptions.RequestException as e:
+            logger.error("Moving %s issues to board %s failed: %s" % (len(batch), self.board_id, e))
+            return list(batch)
+
+    def move(self, batch):
+        failed = self.send(batch)
+        if failed:
+            logger.warning("Moving %s of %s issues to board %s failed, sending them again" % (len(failed), len(batch),
+                                                                                             self.board_id))
+            failed = self.send(failed)
+        moved = [key for key in batch if key not in failed]
+        if moved and self.on_moved is not None:
+            self.on_moved(moved)
+        return moved, failed
+
+    def flush(self):
+        """Sends the last batch, waits for all batches, returns the keys that were moved and the ones that were not"""
+        with self.lock:
+            if self.pending:
+                self.futures.append(self.executor.submit(self.move, self.pending))
+                self.pending = []
+            futures, self.futures = self.futures, []
+        moved, failed = [], []
+        for future in futures:
+            batch_moved, batch_failed = future.result()
+            moved.extend(batch_moved)
+            failed.extend(batch_failed)
+        self.executor.shutdown()
+        return moved, failed
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+_metadata_cache = None
+_scheduler_options = {}
+_base_url = base_url
+_timeout = DEFAULT_TIMEOUT
+
+def get_client(email_address, api_token):
+    # one shared client per credentials, so the module-level functions below reuse the same connections
+    with _clients_lock:
+        client = _clients.get((email_address, api_token))
+        if client is None:
+            client = JiraClient(email_address, api_token, base_url=_base_url, metadata_cache=_metadata_cache,
+                                scheduler=RequestScheduler(**_scheduler_options), timeout=_timeout)
+            _clients[(email_address, api_token)] = client
+        return client
+
+def configure_metadata_cache(path, ttl=DEFAULT_METADATA_CACHE_TTL):
+    global _metadata_cache
+    with _clients_lock:
+        _metadata_cache = MetadataCache(path, ttl) if path else None
+        for client in _clients.values():
+            client.metadata_cache = _metadata_cache
+
+def configure_scheduler(max_rate=DEFAULT_RATE, max_retries=DEFAULT_MAX_RETRIES):
+    with _clients_lock:
+        _scheduler_options.update(max_rate=max_rate, max_retries=max_retries)
+        for client in _clients.values():
+            client.scheduler = RequestScheduler(**_scheduler_options)
+
+def configure_timeout(connect_timeout=DEFAULT_TIMEOUT[0], read_timeout=DEFAULT_TIMEOUT[1]):
+    global _timeout
+    with _clients_lock:
+        _timeout = (connect_timeout, read_timeout)
+        for client in _clients.values():
+            client.timeout = _timeout
+
+def configure_base_url(url):
+    # clients of the previous instance are dropped, the next calls get clients for `url`
+    global _base_url
+    with _clients_lock:
+        _base_url = url
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+def unify_issue_name(name: str):
+    return re.sub('[^A-Za-z0-9]+', '', name).upper()
+
+def get_issue_type_id(auth, project_id, issue_type):
+    return get_client(auth.username, auth.password).get_issue_type_id(project_id, issue_type)
+
+def create_issue(
+        email_address,
+        api_token,
+        issue_type,
+        pillar_label,
+        parent,
+        proj_key,
+        summary,
+        link,
+        ref=None
+):
+    return get_client(email_address, api_token).create_issue(issue_type,
+                                                             pillar_label,
+                                                             parent,
+                                                             proj_key,
+                                                             summary,
+                                                             link,
+                                                             ref)
+
+def create_issues(
+        email_address,
+        api_token,
+        issues: list,
+        run_id=None,
+        run_started=None
+):
+    return get_client(email_address, api_token).create_issues(issues, run_id, run_started)
+
+def find_issues_by_refs(
+        email_address,
+        api_token,
+        issues: list,
+        run_id,
+        run_started
+):
+    return get_client(email_address, api_token).find_issues_by_refs(issues, run_id, run_started)
+
+def get_transition_id_by_name(
+        email_address,
+        api_token,
+        issue_key,
+        transition_name
+):
+    return get_client(email_address, api_token).get_transition_id_by_name(issue_key, transition_name)
+
+def get_transition_id(
+        email_address,
+        api_token,
+        project_id,
+        issue_type,
+        transition_name,
+        issue_key
+):
+    return get_client(email_address, api_token).get_transition_id(project_id, issue_type, transition_name, issue_key)
+
+def invalidate_transition_id(
+        email_address,
+        api_token,
+        project_id,
+        issue_type,
+        transition_name
+):
+    return get_client(email_address, api_token).invalidate_transition_id(project_id, issue_type, transition_name)
+
+def transit_issue(
+        email_address,
+        api_token,
+        issue_key,
+        transition_id
+):
+    return get_client(email_address, api_token).transit_issue(issue_key, transition_id)
+
+def transit_issues(
+        email_address,
+        api_token,
+        issue_keys: list,
+        transition_id
+):
+    return get_client(email_address, api_token).transit_issues(issue_keys, transition_id)
 
 def move_issues_to_board(
         email_address,
@@ -221,19 +947,19 @@ def move_issues_to_board(
         board_id,
         issues: list
 ):
-    url = "{}/{}/issue".format(boards_url, board_id)
-    auth = HTTPBasicAuth(email_address, api_token)
-    headers["Authorization"] = "Bearer {}:{}".format(email_address, api_token)
-    payload = json.dumps( {
-        "issues": issues
-    } )
-    # print(payload)
-
-    response = requests.request(
-        "POST",
-        url,
-        data=payload,
-        headers=headers,
-        auth=auth
-    )
-    return response.status_code
\ No newline at end of file
+    return get_client(email_address, api_token).move_issues_to_board(board_id, issues)
+
+def board_move_queue(email_address, api_token, board_id, on_moved=None):
+    return BoardMoveQueue(get_client(email_address, api_token), board_id, on_moved=on_moved)
+
+def connection_stats(email_address, api_token):
+    return get_client(email_address, api_token).connection_stats()
+
+def issue_type_cache_stats(email_address, api_token):
+    return get_client(email_address, api_token).issue_type_cache_stats()
+
+def transition_cache_stats(email_address, api_token):
+    return get_client(email_address, api_token).transition_cache_stats()
+
+def scheduler_stats(email_address, api_token):
+    return get_client(email_address, api_token).scheduler.stats()
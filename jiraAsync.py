@@ -0,0 +1,179 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from jira import (base_url, issues_path, boards_path, headers, BULK_CREATE_LIMIT, DEFAULT_MAX_RETRIES, DEFAULT_TIMEOUT,
+                  MAX_BACKOFF, RETRY_STATUS_CODES, IDEMPOTENT_METHODS, endpoint_name, issue_payload,
+                  transition_payload, parse_retry_after, unify_issue_name)
+from metrics import metrics
+
+# How many Jira requests one client keeps in flight at the same time
+DEFAULT_CONCURRENCY = 50
+
+logger = logging.getLogger(__name__)
+
+JiraResponse = namedtuple("JiraResponse", ["status_code", "text", "headers"])
+
+
+class AsyncJiraClient:
+    """asyncio counterpart of jira.JiraClient: create_issue(s), get_transition_id_by_name, transit_issue and
+    move_issues_to_board as coroutines, so that many issue writes can be in flight from one event loop
+
+    At most `concurrency` requests are sent at the same time. Headers are an immutable mapping given to every
+    request, nothing is shared between requests. Use it as `async with AsyncJiraClient(...) as client:`.
+    Needs aiohttp (pip3 install aiohttp).
+    """
+
+    def __init__(self, email_address, api_token, base_url=base_url, concurrency=DEFAULT_CONCURRENCY,
+                 max_retries=DEFAULT_MAX_RETRIES, timeout=DEFAULT_TIMEOUT):
+        if aiohttp is None:
+            raise ImportError("AsyncJiraClient needs aiohttp, install it with: pip3 install aiohttp")
+        self.base_url = base_url
+        self.issues_url = "{}{}".format(base_url, issues_path)
+        self.boards_url = "{}{}".format(base_url, boards_path)
+        self.auth = aiohttp.BasicAuth(email_address, api_token)
+        self.headers = MappingProxyType(dict(headers))
+        self.concurrency = concurrency
+        self.semaphore = asyncio.BoundedSemaphore(concurrency)
+        self.max_retries = max_retries
+        # (connect, read) seconds, as the timeout of JiraClient
+        self.timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        self.session = None
+        self.issue_types = {}
+        self.issue_types_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(auth=self.auth,
+                                             connector=aiohttp.TCPConnector(limit=self.concurrency),
+                                             timeout=self.timeout)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def request(self, method, url, payload=None, idempotent=None):
+        # same retry rules as JiraClient.request: 429 always, 5xx and connection errors only when idempotent
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        endpoint = endpoint_name(self.base_url, method, url)
+        attempt = 0
+        while True:
+            delay = None
+            async with self.semaphore:
+                started = time.monotonic()
+                try:
+                    async with self.session.request(method, url, data=payload, headers=self.headers) as response:
+                        result = JiraResponse(response.status, await response.text(), response.headers)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    metrics.observe("jira", endpoint, time.monotonic() - started, error=True,
+                                    retries=min(attempt, 1), bytes_sent=len(payload or ""))
+                    if not idempotent or attempt >= self.max_retries:
+                        raise
+                    delay = self.backoff(attempt)
+                    logger.warning("%s %s failed (%s), retrying in %.1fs" % (method, url, e, delay))
+                else:
+                    metrics.observe("jira", endpoint, time.monotonic() - started, error=result.status_code >= 400,
+                                    retries=min(attempt, 1), bytes_sent=len(payload or ""),
+                                    bytes_received=len(result.text))
+                    retry = result.status_code == 429 or (idempotent and result.status_code in RETRY_STATUS_CODES)
+                    if not retry or attempt >= self.max_retries:
+                        return result
+                    delay = self.backoff(attempt, result)
+                    logger.warning("%s %s: status code is %s, retrying in %.1fs" % (method, url, result.status_code,
+                                                                                    delay))
+            # waiting does not hold a slot of the semaphore
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def backoff(self, attempt, response=None):
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return min(retry_after, MAX_BACKOFF)
+        return min(2 ** attempt + random.random(), MAX_BACKOFF)
+
+    async def get_issue_type_id(self, project_id, issue_type):
+        # fetched once per project, concurrent callers wait for the first one
+        async with self.issue_types_lock:
+            issue_types = self.issue_types.get(project_id)
+            if issue_types is None:
+                response = await self.request("GET", "{}/api/3/project/{}".format(self.base_url, project_id))
+                issue_types = {}
+                for it in json.loads(response.text)["issueTypes"]:
+                    issue_types[unify_issue_name(it["name"])] = it["id"]
+                self.issue_types[project_id] = issue_types
+        return issue_types[unify_issue_name(issue_type)]
+
+    async def create_issue(self, issue_type, pillar_label, parent, proj_key, summary, link, ref=None):
+        return (await self.create_issues([{"issue_type": issue_type,
+                                           "pillar_label": pillar_label,
+                                           "parent": parent,
+                                           "proj_key": proj_key,
+                                           "summary": summary,
+                                           "link": link,
+                                           "ref": ref}]))[0]
+
+    async def create_issues(self, issues: list):
+        """Creates issues with /issue/bulk requests sent concurrently, returns the keys in the order of `issues`,
+        None for the ones that were not created"""
+        batches = [issues[start:start + BULK_CREATE_LIMIT] for start in range(0, len(issues), BULK_CREATE_LIMIT)]
+        results = await asyncio.gather(*[self.create_issue_batch(batch) for batch in batches])
+        return [key for keys in results for key in keys]
+
+    async def create_issue_batch(self, batch: list):
+        keys = [None] * len(batch)
+        updates = []
+        for issue in batch:
+            issue_type_id = await self.get_issue_type_id(issue["proj_key"], issue["issue_type"])
+            updates.append(issue_payload(issue_type_id, issue["pillar_label"], issue["parent"], issue["proj_key"],
+                                         issue["summary"], issue["link"], issue.get("ref")))
+        response = await self.request("POST", "{}/bulk".format(self.issues_url),
+                                      json.dumps({"issueUpdates": updates}), idempotent=False)
+        try:
+            result = json.loads(response.text)
+        except ValueError:
+            result = {}
+        if response.status_code not in (200, 201, 400) or "issues" not in result:
+            logger.error("Bulk creation of %s issues failed with status code %s: %s" % (len(batch),
+                                                                                     response.status_code,
+                                                                                     response.text))
+            return keys
+        failed = {error["failedElementNumber"]: error for error in result.get("errors", [])}
+        created = iter(result["issues"])
+        for i, issue in enumerate(batch):
+            if i in failed:
+                logger.error("Jira rejected issue `%s`: %s" % (issue["summary"], failed[i].get("elementErrors")))
+            else:
+                keys[i] = next(created)["key"]
+        return keys
+
+    async def get_transition_id_by_name(self, issue_key, transition_name):
+        response = await self.request("GET", "{}/{}/transitions".format(self.issues_url, issue_key))
+        for tr in json.loads(response.text)["transitions"]:
+            if tr["name"].upper() == transition_name.upper():
+                return tr["id"]
+        return None
+
+    async def transit_issue(self, issue_key, transition_id):
+        response = await self.request("POST", "{}/{}/transitions".format(self.issues_url, issue_key),
+                                      transition_payload(transition_id), idempotent=False)
+        return response.status_code
+
+    async def move_issues_to_board(self, board_id, issues: list):
+        response = await self.request("POST", "{}/{}/issue".format(self.boards_url, board_id),
+                                      json.dumps({"issues": issues}), idempotent=True)
+        return response.status_code
@@ -0,0 +1,38 @@
+import json
+
+# Lists longer than this are cut in debug output, 0 means they are logged whole
+DEFAULT_SAMPLE_SIZE = 0
+
+sample_size = DEFAULT_SAMPLE_SIZE
+
+
+class LazyJson:
+    """Logging argument that is serialized to JSON only when the record is actually emitted
+
+    Pass it as an argument of the logger call, not through the `%` operator, so that nothing is serialized
+    when DEBUG is disabled: logger.debug("response: %s", LazyJson(response))
+    """
+
+    def __init__(self, value, indent=4):
+        self.value = value
+        self.indent = indent
+
+    def __str__(self):
+        value = sample(self.value, sample_size) if sample_size else self.value
+        return json.dumps(value, indent=self.indent, default=str)
+
+
+def sample(value, size):
+    """Copy of `value` with every list cut to its first `size` items and a note of how many were left out"""
+    if isinstance(value, dict):
+        return {key: sample(item, size) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        items = [sample(item, size) for item in value[:size]]
+        if len(value) > size:
+            items.append("... {} more items".format(len(value) - size))
+        return items
+    return value
+
+def configure_sampling(size):
+    global sample_size
+    sample_size = size
@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+
+# Upper bounds in seconds of the latency histogram buckets, the last bucket takes everything slower
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRIC_PREFIX = "wa2jira"
+
+
+class EndpointMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the `fraction` percentile, capped at the max latency"""
+        rank = fraction * self.requests
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min(LATENCY_BUCKETS[i], self.max_seconds) if i < len(LATENCY_BUCKETS) else self.max_seconds
+        return 0.0
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "bytesSent": self.bytes_sent,
+            "bytesReceived": self.bytes_received,
+            "seconds": self.seconds,
+            "maxSeconds": self.max_seconds,
+            "buckets": dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"], self.buckets))
+        }
+
+
+class Metrics:
+    """Counts, latency histograms, retries and bytes of the outbound calls of a run, per service and endpoint,
+    plus named counters such as cache hits"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.counters = {}
+
+    def observe(self, service, endpoint, seconds, error=False, retries=0, bytes_sent=0, bytes_received=0):
+        with self.lock:
+            metrics = self.endpoints.get((service, endpoint))
+            if metrics is None:
+                metrics = self.endpoints[(service, endpoint)] = EndpointMetrics()
+            metrics.requests += 1
+            metrics.errors += 1 if error else 0
+            metrics.retries += retries
+            metrics.bytes_sent += bytes_sent
+            metrics.bytes_received += bytes_received
+            metrics.seconds += seconds
+            metrics.max_seconds = max(metrics.max_seconds, seconds)
+            bucket = 0
+            while bucket < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[bucket]:
+                bucket += 1
+            metrics.buckets[bucket] += 1
+
+    def count(self, service, counter, value=1):
+        with self.lock:
+            self.counters[(service, counter)] = self.counters.get((service, counter), 0) + value
+
+    def reset(self):
+        with self.lock:
+            self.endpoints = {}
+            self.counters = {}
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "endpoints": [dict(service=service, endpoint=endpoint, **metrics.as_dict())
+                              for (service, endpoint), metrics in sorted(self.endpoints.items())],
+                "counters": [{"service": service, "counter": counter, "value": value}
+                             for (service, counter), value in sorted(self.counters.items())]
+            }
+
+    def summary_table(self):
+        header = ("service", "endpoint", "requests", "errors", "retries", "total s", "mean ms", "p95 ms", "max ms",
+                  "KB out", "KB in")
+        rows = []
+        with self.lock:
+            for (service, endpoint), metrics in sorted(self.endpoints.items()):
+                rows.append((service,
+                             endpoint,
+                             str(metrics.requests),
+                             str(metrics.errors),
+                             str(metrics.retries),
+                             "{:.2f}".format(metrics.seconds),
+                             "{:.0f}".format(metrics.seconds / metrics.requests * 1000),
+                             "{:.0f}".format(metrics.percentile(0.95) * 1000),
+                             "{:.0f}".format(metrics.max_seconds * 1000),
+                             "{:.1f}".format(metrics.bytes_sent / 1024),
+                             "{:.1f}".format(metrics.bytes_received / 1024)))
+            counters = sorted(self.counters.items())
+        widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+        lines = []
+        for row in [header] + rows:
+            cells = [cell.ljust(width) if i < 2 else cell.rjust(width) for i, (cell, width) in enumerate(zip(row, widths))]
+            lines.append("  ".join(cells))
+        lines.insert(1, "  ".join("-" * width for width in widths))
+        for (service, counter), value in counters:
+            lines.append("{} {}: {}".format(service, counter, value))
+        return "\n".join(lines)
+
+    def to_prometheus(self):
+        """Prometheus text exposition format, as read by the node_exporter textfile collector"""
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append("# HELP {}_{} {}".format(METRIC_PREFIX, name, help_text))
+            lines.append("# TYPE {}_{} {}".format(METRIC_PREFIX, name, kind))
+
+        def sample(name, labels, value):
+            lines.append("{}_{}{{{}}} {}".format(METRIC_PREFIX, name, ",".join(
+                '{}="{}"'.format(label, escape_label(label_value)) for label, label_value in labels), value))
+
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            counters = sorted(self.counters.items())
+        for name, attribute, help_text in [("requests_total", "requests", "Outbound requests"),
+                                           ("request_errors_total", "errors", "Outbound requests that failed"),
+                                           ("request_retries_total", "retries", "Retries of outbound requests"),
+                                           ("request_sent_bytes_total", "bytes_sent", "Bytes sent in request bodies"),
+                                           ("request_received_bytes_total", "bytes_received", "Bytes received in response bodies")]:
+            metric(name, "counter", help_text)
+            for (service, endpoint), metrics in endpoints:
+                sample(name, [("service", service), ("endpoint", endpoint)], getattr(metrics, attribute))
+        metric("request_duration_seconds", "histogram", "Latency of outbound requests")
+        for (service, endpoint), metrics in endpoints:
+            labels = [("service", service), ("endpoint", endpoint)]
+            cumulative = 0
+            for bound, count in zip([str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"], metrics.buckets):
+                cumulative += count
+                sample("request_duration_seconds_bucket", labels + [("le", bound)], cumulative)
+            sample("request_duration_seconds_sum", labels, metrics.seconds)
+            sample("request_duration_seconds_count", labels, metrics.requests)
+        metric("events_total", "counter", "Named events of the run, such as cache hits")
+        for (service, counter), value in counters:
+            sample("events_total", [("service", service), ("event", counter)], value)
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, format="json"):
+        # written to a temporary file first, so that a collector never reads half a file
+        tmp_path = "{}.tmp".format(path)
+        with open(tmp_path, "w") as f:
+            if format == "prometheus":
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.as_dict(), f, indent=1)
+        os.replace(tmp_path, path)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+metrics = Metrics()
@@ -1,39 +1,343 @@
 #!/usr/bin/env python3
 
-import requests
+import hashlib
 import json
+import logging
+import os
 import re
-from bs4 import BeautifulSoup
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urlparse
+from metrics import metrics
 
 risk_levels = ["High", "Medium", "Low"]
 
-# Function to parse the web pages and extract the required information
-def parse_web_page(url):
-    response = requests.get(url)
-
-    soup = BeautifulSoup(response.content, "html.parser")
-    risk_elements = soup.find_all('p')
-    for i, element in enumerate(risk_elements):
-        if "established:" in element.get_text():
-            # risk_value = element.get_text().split(": ")[-1].strip()
-            candidate = element.get_text().split(": ")[-1].strip()
-            risks = {}
-            # risk_value = None
-            for risk in risk_levels:
-                risks[risk] = risk in candidate
-                # risk_value = risk
-            if list(risks.values()).count(True) == 1:
-                return list(risks.keys())[list(risks.values()).index(True)]
-                # return risk_value
-            elif list(risks.values()).count(True) > 1:
-                print("More than 1 risk level indicator found in:\n{}".format(element))
-            else:
-                print("No risk level indicators found in:\n{}".format(element))
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "wa2jira", "docs")
+DEFAULT_CACHE_MAX_SIZE = 200 * 1024 * 1024
+# Pages younger than this are served from disk without asking the docs site
+DEFAULT_CACHE_MAX_AGE = 24 * 60 * 60
+DEFAULT_WORKERS = 8
+# (connect, read) seconds before a documentation request is given up
+DEFAULT_TIMEOUT = (10, 30)
+DOC_URL_TEMPLATE = "https://docs.aws.amazon.com/wellarchitected/{}/framework/{}.html"
+
+logger = logging.getLogger(__name__)
+
+session = None
+session_lock = threading.Lock()
+
+def get_session():
+    # built on first use, so that importing this module does not load the HTTP stack
+    global session
+    with session_lock:
+        if session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        return session
+
+
+class HostRateLimiter:
+    """Spaces out requests to the same host so that no more than `rate` of them start per second"""
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, url):
+        if not self.rate:
+            return
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + 1.0 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+rate_limiter = HostRateLimiter()
+
+def configure_rate_limit(rate):
+    rate_limiter.rate = rate
+
+def get(url, headers=None):
+    import requests
+    rate_limiter.wait(url)
+    endpoint = "GET {}".format(urlparse(url).netloc)
+    started = time.monotonic()
+    try:
+        response = get_session().get(url, headers=headers, timeout=DEFAULT_TIMEOUT)
+    except requests.exceptions.RequestException:
+        metrics.observe("docs", endpoint, time.monotonic() - started, error=True)
+        raise
+    metrics.observe("docs", endpoint, time.monotonic() - started, error=response.status_code >= 400,
+                    bytes_received=len(response.content))
+    return response
+
+def choice_page_url(lens_version, choice_id):
+    return DOC_URL_TEMPLATE.format(lens_version, choice_id)
+
+
+class PageCache:
+    """On-disk cache of documentation pages, keyed by a hash of lens version and URL
+
+    Stale pages are revalidated with ETag/Last-Modified, the least recently used ones are evicted once
+    the cache grows over `max_size` bytes, and `offline` mode serves cached pages only.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_MAX_SIZE,
+                 max_age=DEFAULT_CACHE_MAX_AGE, offline=False):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.max_age = max_age
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in os.scandir(cache_dir) if entry.is_file())
+
+    def _paths(self, url, lens_version):
+        key = hashlib.sha256("{}|{}".format(lens_version or "", url).encode()).hexdigest()
+        return os.path.join(self.cache_dir, "{}.html".format(key)), os.path.join(self.cache_dir, "{}.json".format(key))
+
+    def get(self, url, lens_version=None):
+        body_path, meta_path = self._paths(url, lens_version)
+        meta = None
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            meta = None
+        if meta is not None and (self.offline or time.time() - meta["fetched_at"] < self.max_age):
+            self._count("hits")
+            self._touch(body_path)
+            return body
+        if self.offline:
+            raise ValueError("Page {} is not cached and offline mode is on".format(url))
+        conditional_headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                conditional_headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                conditional_headers["If-Modified-Since"] = meta["last_modified"]
+        response = get(url, conditional_headers)
+        if response.status_code == 304 and meta is not None:
+            self._count("revalidated")
+            meta["fetched_at"] = time.time()
+            self._write(meta_path, json.dumps(meta).encode())
+            self._touch(body_path)
+            return body
+        self._count("misses")
+        if response.status_code != 200:
+            if meta is not None:
+                logger.warning("Revalidating %s returned HTTP %s, using the cached page" % (url, response.status_code))
+                return body
+            return response.content
+        meta = {
+            "url": url,
+            "lens_version": lens_version,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": time.time()
+        }
+        self._write(body_path, response.content)
+        self._write(meta_path, json.dumps(meta).encode())
+        self._evict()
+        return response.content
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _count(self, counter):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+        metrics.count("docs", "cache_{}".format(counter))
+
+    def _write(self, path, data):
+        tmp_path = "{}.{}.tmp".format(path, threading.get_ident())
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        with self.lock:
+            if os.path.exists(path):
+                self.size -= os.path.getsize(path)
+            os.replace(tmp_path, path)
+            self.size += len(data)
+
+    def _evict(self):
+        with self.lock:
+            if self.size <= self.max_size:
+                return
+            # pages are touched on every hit, so the oldest mtime is the least recently used one
+            pages = sorted((entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".html")),
+                           key=lambda entry: entry.stat().st_mtime)
+            for page in pages:
+                if self.size <= self.max_size:
+                    break
+                for path in (page.path, page.path[:-len(".html")] + ".json"):
+                    try:
+                        self.size -= os.path.getsize(path)
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+
+page_cache = None
+
+def configure_page_cache(cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_MAX_SIZE,
+                         max_age=DEFAULT_CACHE_MAX_AGE, offline=False):
+    global page_cache
+    if offline and not cache_dir:
+        raise ValueError("Offline mode needs a documentation cache directory")
+    page_cache = PageCache(cache_dir, max_size, max_age, offline) if cache_dir else None
+    return page_cache
+
+def fetch_page(url, lens_version=None):
+    if page_cache is not None:
+        return page_cache.get(url, lens_version)
+    return get(url).content
+
+def find_risk_level(paragraph):
+    """Returns the risk level named in the text of a paragraph, None if there is not exactly one"""
+    candidate = paragraph.split(": ")[-1].strip()
+    found = [risk for risk in risk_levels if risk in candidate]
+    if len(found) == 1:
+        return found[0]
+    elif len(found) > 1:
+        print("More than 1 risk level indicator found in:\n{}".format(paragraph))
+    else:
+        print("No risk level indicators found in:\n{}".format(paragraph))
     return None
 
-def get_implementation_steps(url):
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, "html.parser")
+
+# Text that BeautifulSoup's get_text() leaves out of the text of a paragraph
+SKIPPED_TEXT_TAGS = ("script", "style", "template")
+# Elements without an end tag
+VOID_TAGS = frozenset(("area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "menuitem",
+                       "meta", "param", "source", "track", "wbr", "basefont", "bgsound", "command", "frame",
+                       "image", "isindex", "nextid", "spacer"))
+
+
+class _RiskLevelFound(Exception):
+    pass
+
+
+class RiskLevelParser(HTMLParser):
+    """Scans the page for the "...established: <level>" paragraph without building a document tree
+
+    The text of a <p> includes the text of all its descendants. Paragraphs are checked in the order they
+    start in, once the outermost open one is closed, and the scan stops at the first one naming exactly
+    one risk level. Text inside <script>, <style> and <template> is not part of any paragraph.
+
+    As in BeautifulSoup, an end tag also closes the elements opened after its start tag, and an end tag
+    without an open element is ignored.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.paragraphs = []
+        self.open_paragraphs = []
+        self.open_tags = []
+        self.skipped = 0
+        self.risk_level = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            return
+        self.open_tags.append(tag)
+        if tag in SKIPPED_TEXT_TAGS:
+            self.skipped += 1
+        elif tag == "p":
+            self.paragraphs.append([])
+            self.open_paragraphs.append(self.paragraphs[-1])
+
+    def handle_endtag(self, tag):
+        if tag not in self.open_tags:
+            return
+        while True:
+            open_tag = self.open_tags.pop()
+            if open_tag in SKIPPED_TEXT_TAGS:
+                self.skipped -= 1
+            elif open_tag == "p":
+                self.open_paragraphs.pop()
+                if not self.open_paragraphs:
+                    self.check_paragraphs()
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self.skipped:
+            return
+        for paragraph in self.open_paragraphs:
+            paragraph.append(data)
+
+    def check_paragraphs(self):
+        paragraphs, self.paragraphs = self.paragraphs, []
+        for paragraph in paragraphs:
+            text = "".join(paragraph)
+            if "established:" in text:
+                self.risk_level = find_risk_level(text)
+                if self.risk_level is not None:
+                    raise _RiskLevelFound()
+
+    def close(self):
+        super().close()
+        # paragraphs left open at the end of the page
+        del self.open_paragraphs[:]
+        self.check_paragraphs()
+
+
+def parse_risk_level(content, chunk_size=64 * 1024):
+    """Returns the risk level of a best practice page, None if the page does not name one"""
+    if isinstance(content, bytes):
+        content = content.decode("utf-8", errors="replace")
+    parser = RiskLevelParser()
+    try:
+        for start in range(0, len(content), chunk_size):
+            parser.feed(content[start:start + chunk_size])
+        parser.close()
+    except _RiskLevelFound:
+        pass
+    return parser.risk_level
+
+# Function to parse the web pages and extract the required information
+def parse_web_page(url, lens_version=None):
+    return parse_risk_level(fetch_page(url, lens_version))
+
+def resolve_risk_levels(choice_ids, lens_version="latest", max_workers=DEFAULT_WORKERS):
+    """Fetches and parses the pages of all `choice_ids` in parallel, returns choice_id -> risk level map"""
+    import requests
+
+    def resolve(choice_id):
+        url = choice_page_url(lens_version, choice_id)
+        try:
+            return parse_web_page(url, lens_version)
+        except (ValueError, requests.exceptions.RequestException) as e:
+            logger.error("Could not get risk level from %s: %s" % (url, e))
+            return None
+
+    choice_ids = list(dict.fromkeys(choice_ids))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(choice_ids, executor.map(resolve, choice_ids)))
+
+def get_implementation_steps(url, lens_version=None):
+    # bs4 is only needed here, it is imported on first use to keep the import of this module cheap
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(fetch_page(url, lens_version), "html.parser")
     ul = None
     b_element = soup.find('b', string = re.compile("Implementation steps"))
     if b_element:
@@ -72,7 +376,7 @@ def main():
     # Dictionary containing URLs and expected results
     url_to_expected_result = {}
     for choice in CHOICE_ID_RISK_LEVEL_MAP:
-        url = "https://docs.aws.amazon.com/wellarchitected/latest/framework/{}.html".format(choice)
+        url = choice_page_url("latest", choice)
         url_to_expected_result[url] = CHOICE_ID_RISK_LEVEL_MAP[choice]
 
     results = parse_web_pages(url_to_expected_result)
@@ -84,6 +388,10 @@ def main():
         print(f"Expected Result: {data['Expected Result']}")
         print(f"Result: {'Correct' if data['Result'] else 'Incorrect'}")
         print("-" * 50)
+    incorrect = [url for url, data in results.items() if not data["Result"]]
+    print("{} of {} risk levels match riskLevelMap".format(len(results) - len(incorrect), len(results)))
+    if incorrect:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Offline check that parse_risk_level finds the same risk level as the BeautifulSoup extraction it replaced
+
+Run with: python3 -m unittest parseAwsDocWebPages_test
+"""
+
+import contextlib
+import io
+import unittest
+
+from bs4 import BeautifulSoup
+
+from parseAwsDocWebPages import parse_risk_level, risk_levels
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>Best practice</title>
+<script>var level = "<p>established: High</p>";</script>
+<style>p.established:after {{ content: "Low"; }}</style>
+</head><body>
+<div id="main-content"><h1>REL09-BP01 Identify and back up all data that needs to be backed up</h1>
+<p><b>Common anti-patterns:</b></p>
+<ul><li>Not backing up data.</li></ul>
+{}
+<h2>Implementation guidance</h2><ul><li>Identify all data sources.</li></ul>
+</div></body></html>"""
+
+FIXTURES = {
+    "plain": PAGE.format("<p><b>Level of risk exposed if this best practice is not established:</b> High</p>"),
+    "entity": PAGE.format("<p>Level of risk exposed if this best practice is not established:&nbsp;Medium</p>"),
+    "line break": PAGE.format("<p>established: Low<br>more text</p><p>established: High</p>"),
+    "upper case tag": PAGE.format("<P>established: Low</P>"),
+    "comment": PAGE.format("<p>established: <!-- High --> Medium</p>"),
+    "script in paragraph": PAGE.format("<p>established: <script>High</script> Low</p>"),
+    "style in paragraph": PAGE.format("<p>established: <style>High</style> Low</p>"),
+    "template in paragraph": PAGE.format("<p>established: <template><p>High</p></template> Low</p>"),
+    "nested": PAGE.format("<p>a <p>established: High</p> tail Low</p>"),
+    "nested, outer ambiguous": PAGE.format("<p>established: High and Low<p>established: Medium</p></p>"),
+    "nested, both named": PAGE.format("<p>one established: High <p>two established: Low</p> rest</p>"),
+    "unclosed": "<html><body><p>established: Medium",
+    "unclosed, nested": "<p>established: <p>Low</p>",
+    "split by div": PAGE.format("<div><p>established: Hi</div><p>gh</p>"),
+    "closed by div": PAGE.format("<div><p>established: High</div> Low</p>"),
+    "stray end tags": PAGE.format("</p></span><p>established: </i>Medium</p>"),
+    "self-closing": PAGE.format("<p>established: <span/>Low<br/></p>"),
+    "two levels": PAGE.format("<p>established: High or Medium</p>"),
+    "no level": PAGE.format("<p>Nothing to see here</p>"),
+}
+
+
+def baseline_risk_level(content):
+    # the extraction parse_web_page used before the streaming parser
+    soup = BeautifulSoup(content, "html.parser")
+    for element in soup.find_all('p'):
+        if "established:" in element.get_text():
+            candidate = element.get_text().split(": ")[-1].strip()
+            found = [risk for risk in risk_levels if risk in candidate]
+            if len(found) == 1:
+                return found[0]
+    return None
+
+
+class RiskLevelParityTest(unittest.TestCase):
+
+    def test_same_risk_level_as_beautifulsoup(self):
+        for name, page in FIXTURES.items():
+            with self.subTest(name), contextlib.redirect_stdout(io.StringIO()):
+                self.assertEqual(parse_risk_level(page), baseline_risk_level(page))
+
+    def test_small_chunks(self):
+        for name, page in FIXTURES.items():
+            with self.subTest(name), contextlib.redirect_stdout(io.StringIO()):
+                self.assertEqual(parse_risk_level(page.encode(), chunk_size=7), baseline_risk_level(page))
+
+    def test_risk_level_found(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(parse_risk_level(FIXTURES["plain"]), "High")
+            self.assertEqual(parse_risk_level(FIXTURES["script in paragraph"]), "Low")
+
+
+if __name__ == "__main__":
+    unittest.main()
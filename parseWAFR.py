@@ -4,46 +4,40 @@ import json
 import logging
 import sys
 import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import argparse
-import botocore
-import boto3
-from jira import create_issue, transit_issue, get_transition_id_by_name, move_issues_to_board
-from parseAwsDocWebPages import parse_web_page
-from pkg_resources import packaging
+from jira import (create_issues, find_issues_by_refs, transit_issue, transit_issues, get_transition_id, invalidate_transition_id,
+                  board_move_queue, connection_stats, configure_metadata_cache, issue_type_cache_stats, transition_cache_stats,
+                  configure_scheduler, configure_timeout, scheduler_stats, BULK_TRANSITION_LIMIT, DEFAULT_TIMEOUT)
+from parseAwsDocWebPages import (configure_page_cache, configure_rate_limit, resolve_risk_levels,
+                                 choice_page_url, DEFAULT_CACHE_DIR, DEFAULT_WORKERS)
+from riskLevelMap import load_risk_level_index, RISK_LEVEL_INDEX_DIR, NOT_HIGH
+from syncState import SyncState
+from runJournal import RunJournal, task_ref, subtask_ref, dedup_run
+from pipeline import Pipeline, DEFAULT_QUEUE_SIZE
+from answerSnapshot import load_snapshot, SnapshotClient
+from waAnswers import fetch_answers, create_wa_client, version_tuple, BOTO3_MIN_VERSION
+from metrics import metrics
+from lazyLog import LazyJson, configure_sampling
+from hriChoices import evaluate_hri_choices
+from changePlan import new_plan, save_plan, load_plan, plan_counts
 
 response = ""
 
 
-# Setup Logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s.%(msecs)03d %(levelname)s %(module)s - %(funcName)s: %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-)
-
 logger = logging.getLogger()
-logging.getLogger('boto3').setLevel(logging.CRITICAL)
-logging.getLogger('botocore').setLevel(logging.CRITICAL)
-PARSER = argparse.ArgumentParser(
-    formatter_class=argparse.RawDescriptionHelpFormatter,
-    )
 
 DEFAULT_LENS_ALIAS="wellarchitected"
 
-try:
-    aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID']
-    aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
-    aws_session_token=os.environ['AWS_SESSION_TOKEN']
-    api_token=os.environ['JIRA_TOKEN']
-    email_address=os.environ['JIRA_EMAIL']
-except KeyError:
-    print("""At least one of the following environment variables: AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_SESSION_TOKEN, JIRA_TOKEN, JIRA_EMAIL is not defined.
-          Set `JIRA_EMAIL` with Jira login email address, `JIRA_TOKEN` with actual Jira API Token value, and AWS-based ones with appropriate values, then run again""")
-    exit(1)
-except:
-    print("Unexpected error:", sys.exc_info()[0])
-    raise
+# read from the environment by read_credentials() when the script runs, not when it is imported
+aws_access_key_id = None
+aws_secret_access_key = None
+aws_session_token = None
+api_token = None
+email_address = None
 
 PARSER = argparse.ArgumentParser(
     formatter_class=argparse.RawDescriptionHelpFormatter
@@ -51,36 +45,136 @@ PARSER = argparse.ArgumentParser(
 
 PARSER.add_argument('-p','--profile', required=False, default="default", help='AWS CLI Profile Name')
 PARSER.add_argument('-r','--region', required=False, default="eu-central-1", help='From Region Name. Example: us-east-1')
-PARSER.add_argument('-w','--workloadId', required=True, help='Workload Id to use instead of creating a TEMP workload')
+PARSER.add_argument('-w','--workloadId', required=False, help='Workload Id to use instead of creating a TEMP workload')
 PARSER.add_argument('-m','--milestoneNumber', required=False, default=1, help='Milestone number to take answers from')
 #PARSER.add_argument('-a','--lensAlias', required=False, default=DEFAULT_LENS_ALIAS, help='Lense alias which questions to take from') #do we need it? page parsing won't work for other lenses 
 PARSER.add_argument('-l','--lensVersion', required=False, default="latest", help='Lense version which questions to take from and appropriately for builing link to documentation')
-PARSER.add_argument('-j','--jiraProject', required=True, help='Jira Project Key where new issues to be created')
-PARSER.add_argument('-e','--jiraEpic', required=True, help='Jira Epic Key where new issues to be created')
+PARSER.add_argument('-j','--jiraProject', required=False, help='Jira Project Key where new issues to be created')
+PARSER.add_argument('-e','--jiraEpic', required=False, help='Jira Epic Key where new issues to be created')
 PARSER.add_argument('-b','--jiraBoard', required=False, default="15", help='Jira board ID where to move created tasks')
+PARSER.add_argument('--batchFile', required=False, help='JSON list of {"workloadId", "jiraProject", "jiraEpic", "jiraBoard", "snapshot"} objects to process instead of -w/-j/-e/-b')
+PARSER.add_argument('--workers', required=False, type=int, default=4, help='Number of workloads of --batchFile processed in parallel')
 PARSER.add_argument('-v','--debug', action='store_true', help='print debug messages to stderr')
 PARSER.add_argument('-n','--doNotMoveToBoard', action='store_true', help='do not move tasks to board')
+PARSER.add_argument('--jiraCacheFile', required=False, default=None, help='JSON file to keep Jira issue types and transition ids between runs (disabled if not set)')
+PARSER.add_argument('--jiraCacheTtl', required=False, type=int, default=24 * 60 * 60, help='Seconds before cached Jira metadata is fetched again')
+PARSER.add_argument('--docCacheDir', required=False, default=DEFAULT_CACHE_DIR, help='Directory to cache documentation pages in, empty string disables the cache')
+PARSER.add_argument('--docCacheMaxSize', required=False, type=int, default=200, help='Documentation cache size limit in MB')
+PARSER.add_argument('--docCacheMaxAge', required=False, type=int, default=24 * 60 * 60, help='Seconds before a cached documentation page is revalidated')
+PARSER.add_argument('--offline', action='store_true', help='take documentation pages from the cache only, never from the network')
+PARSER.add_argument('--docWorkers', required=False, type=int, default=DEFAULT_WORKERS, help='Number of documentation pages fetched in parallel')
+PARSER.add_argument('--docRateLimit', required=False, type=float, default=0, help='Max documentation requests per second per host, 0 means no limit')
+PARSER.add_argument('--riskIndexDir', required=False, default=RISK_LEVEL_INDEX_DIR, help='Directory with prebuilt risk level indexes (see buildRiskLevelIndex.py)')
+PARSER.add_argument('--riskSource', required=False, default="index", choices=["index", "wa-api", "scrape"], help='Where choice risk levels come from: "index" looks them up in --riskIndexDir, "wa-api" first rules out the choices the WA question risks show are not High, then uses the index, "scrape" reads every choice page. Choices not resolved otherwise are always scraped')
+PARSER.add_argument('-s','--sync', action='store_true', help='only create and transit the issues that changed since the previous run (see --stateFile)')
+PARSER.add_argument('--stateFile', required=False, default="wa2jira-state.json", help='JSON file keeping the Jira issues created for each workload answer and choice, used by --sync')
+PARSER.add_argument('--journalFile', required=False, default="wa2jira-journal.jsonl", help='Append-only log of the Jira writes of the run, used by --resume')
+PARSER.add_argument('--resume', action='store_true', help='continue an interrupted run from the first step missing in --journalFile')
+PARSER.add_argument('--jiraRateLimit', required=False, type=float, default=10, help='Max Jira requests per second, lowered automatically while Jira throttles')
+PARSER.add_argument('--jiraMaxRetries', required=False, type=int, default=5, help='How many times a throttled or failed Jira request is retried')
+PARSER.add_argument('--jiraConnectTimeout', required=False, type=float, default=DEFAULT_TIMEOUT[0], help='Seconds to wait for a connection to Jira')
+PARSER.add_argument('--jiraReadTimeout', required=False, type=float, default=DEFAULT_TIMEOUT[1], help='Seconds to wait for a Jira response before the request counts as failed')
+PARSER.add_argument('--bulkTransitions', action='store_true', help='transit the issues at the end of the run with bulk transition requests instead of one request per issue')
+PARSER.add_argument('--metricsFile', required=False, default=None, help='File to write the request metrics of the run to, e.g. for the Prometheus textfile collector')
+PARSER.add_argument('--metricsFormat', required=False, default="json", choices=["json", "prometheus"], help='Format of --metricsFile')
+PARSER.add_argument('--debugSampleSize', required=False, type=int, default=0, help='Log only the first N items of every list in debug output, 0 logs them whole')
+PARSER.add_argument('--plan', required=False, default=None, help='only analyse the workloads and write the Jira changes they need to this JSON plan, nothing is written to Jira')
+PARSER.add_argument('--apply', required=False, default=None, help='make the Jira changes of a plan written by --plan, WA is not read')
+PARSER.add_argument('--fromSnapshot', required=False, default=None, help='take the answers from a file written by snapshotAnswers.py instead of AWS, -w defaults to the workload of the snapshot')
+PARSER.add_argument('--pipelineQueueSize', required=False, type=int, default=DEFAULT_QUEUE_SIZE, help='How many pillars may wait between two stages of the run')
+
+def parse_arguments(argv=None):
+    arguments = PARSER.parse_args(argv)
+    if arguments.plan and arguments.apply:
+        PARSER.error("--plan and --apply can not be used together")
+    if not arguments.batchFile and not arguments.apply and not ((arguments.workloadId or arguments.fromSnapshot) and arguments.jiraProject and arguments.jiraEpic):
+        PARSER.error("either --batchFile, --apply or all of --workloadId, --jiraProject, --jiraEpic are required")
+    if arguments.offline and not arguments.docCacheDir:
+        PARSER.error("--offline needs a --docCacheDir to take the pages from")
+    return arguments
+
+def configure(arguments):
+    """Sets the module settings from parsed command line arguments"""
+    global ARGUMENTS, PROFILE, REGION, WORKLOAD_ID, MILESTONE_NUMBER, LENS_ALIAS, LENS_VERSION, PROJ_KEY, EPIC, \
+        BOARD_ID, JIRA_CACHE_FILE, JIRA_CACHE_TTL, DOC_CACHE_DIR, DOC_CACHE_MAX_SIZE, DOC_CACHE_MAX_AGE, OFFLINE, \
+        DOC_WORKERS, DOC_RATE_LIMIT, RISK_INDEX_DIR, RISK_SOURCE, SYNC, STATE_FILE, JOURNAL_FILE, JIRA_RATE_LIMIT, \
+        JIRA_MAX_RETRIES, JIRA_CONNECT_TIMEOUT, JIRA_READ_TIMEOUT, PIPELINE_QUEUE_SIZE, BULK_TRANSITIONS, METRICS_FILE, PLAN_FILE, APPLY_FILE, \
+        METRICS_FORMAT, RESUME, BATCH_FILE, WORKERS, FROM_SNAPSHOT
+    ARGUMENTS = arguments
+    PROFILE=ARGUMENTS.profile
+    REGION=ARGUMENTS.region
+    WORKLOAD_ID=ARGUMENTS.workloadId
+    MILESTONE_NUMBER=ARGUMENTS.milestoneNumber
+    #LENS_ALIAS=ARGUMENTS.lensAlias
+    LENS_ALIAS=DEFAULT_LENS_ALIAS
+    LENS_VERSION=ARGUMENTS.lensVersion
+    PROJ_KEY=ARGUMENTS.jiraProject
+    EPIC=ARGUMENTS.jiraEpic
+    BOARD_ID=ARGUMENTS.jiraBoard
+    JIRA_CACHE_FILE=ARGUMENTS.jiraCacheFile
+    JIRA_CACHE_TTL=ARGUMENTS.jiraCacheTtl
+    DOC_CACHE_DIR=ARGUMENTS.docCacheDir
+    DOC_CACHE_MAX_SIZE=ARGUMENTS.docCacheMaxSize * 1024 * 1024
+    DOC_CACHE_MAX_AGE=ARGUMENTS.docCacheMaxAge
+    OFFLINE=ARGUMENTS.offline
+    DOC_WORKERS=ARGUMENTS.docWorkers
+    DOC_RATE_LIMIT=ARGUMENTS.docRateLimit
+    RISK_INDEX_DIR=ARGUMENTS.riskIndexDir
+    RISK_SOURCE=ARGUMENTS.riskSource
+    SYNC=ARGUMENTS.sync
+    STATE_FILE=ARGUMENTS.stateFile
+    JOURNAL_FILE=ARGUMENTS.journalFile
+    JIRA_RATE_LIMIT=ARGUMENTS.jiraRateLimit
+    JIRA_MAX_RETRIES=ARGUMENTS.jiraMaxRetries
+    JIRA_CONNECT_TIMEOUT=ARGUMENTS.jiraConnectTimeout
+    JIRA_READ_TIMEOUT=ARGUMENTS.jiraReadTimeout
+    PIPELINE_QUEUE_SIZE=ARGUMENTS.pipelineQueueSize
+    BULK_TRANSITIONS=ARGUMENTS.bulkTransitions
+    METRICS_FILE=ARGUMENTS.metricsFile
+    PLAN_FILE=ARGUMENTS.plan
+    APPLY_FILE=ARGUMENTS.apply
+    METRICS_FORMAT=ARGUMENTS.metricsFormat
+    RESUME=ARGUMENTS.resume
+    BATCH_FILE=ARGUMENTS.batchFile
+    WORKERS=ARGUMENTS.workers
+    FROM_SNAPSHOT=ARGUMENTS.fromSnapshot
 
-ARGUMENTS = PARSER.parse_args()
-PROFILE=ARGUMENTS.profile
-REGION=ARGUMENTS.region
-WORKLOAD_ID=ARGUMENTS.workloadId
-MILESTONE_NUMBER=ARGUMENTS.milestoneNumber
-#LENS_ALIAS=ARGUMENTS.lensAlias
-LENS_ALIAS=DEFAULT_LENS_ALIAS
-LENS_VERSION=ARGUMENTS.lensVersion
-PROJ_KEY=ARGUMENTS.jiraProject
-EPIC=ARGUMENTS.jiraEpic
-BOARD_ID=ARGUMENTS.jiraBoard
-
-if ARGUMENTS.debug:
-    logger.setLevel(logging.DEBUG)
-else:
-    logger.setLevel(logging.INFO)
+def read_credentials(require_aws=True, require_jira=True):
+    global aws_access_key_id, aws_secret_access_key, aws_session_token, api_token, email_address
+    try:
+        # AWS credentials are not needed when the answers come from a plan or a snapshot,
+        # Jira credentials are not needed when the changes are only planned
+        environ = os.environ if require_aws else defaultdict(lambda: None, os.environ)
+        aws_access_key_id=environ['AWS_ACCESS_KEY_ID']
+        aws_secret_access_key=environ['AWS_SECRET_ACCESS_KEY']
+        aws_session_token=environ['AWS_SESSION_TOKEN']
+        environ = os.environ if require_jira else defaultdict(lambda: None, os.environ)
+        api_token=environ['JIRA_TOKEN']
+        email_address=environ['JIRA_EMAIL']
+    except KeyError:
+        print("""At least one of the following environment variables: AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_SESSION_TOKEN, JIRA_TOKEN, JIRA_EMAIL is not defined.
+          Set `JIRA_EMAIL` with Jira login email address, `JIRA_TOKEN` with actual Jira API Token value, and AWS-based ones with appropriate values, then run again""")
+        exit(1)
+
+def setup_logging(debug=False):
+    logging.basicConfig(
+        level=logging.DEBUG,
+        format='%(asctime)s.%(msecs)03d %(levelname)s %(module)s - %(funcName)s: %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+    )
+    logging.getLogger('boto3').setLevel(logging.CRITICAL)
+    logging.getLogger('botocore').setLevel(logging.CRITICAL)
+    if debug:
+        logger.setLevel(logging.DEBUG)
+    else:
+        logger.setLevel(logging.INFO)
+
+# defaults until main() configures the run from the command line
+configure(PARSER.parse_args([]))
 
 #JIRA_WAS_DONE_TRANSITION_ID = 11    # WTB
 #JIRA_WAS_DONE_TRANSITION_ID = 10     # WL
-global JIRA_WAS_DONE_TRANSITION_ID    # to find by name (JIRA_WAS_DONE_TRANSITION_NAME)
+# the transition ID is found by name (JIRA_WAS_DONE_TRANSITION_NAME) per project and issue type, see jira.get_transition_id
 JIRA_WAS_DONE_TRANSITION_NAME = "was selected"
 
 PILLAR_PARSE_MAP = {
@@ -95,211 +189,716 @@ PILLAR_PARSE_MAP = {
 def generate_question_page_name(code: str, index: int):
     return "{}-{}".format(code.lower(), index if index > 9 else "0{}".format(index))
 
-def is_choice_applied(choice_id: str, choice_answer_summaries: list):
-    if len(choice_answer_summaries) == 0:
-        return True
-    for summary in choice_answer_summaries:
-        if summary["ChoiceId"] == choice_id:
-            return summary["Status"] != "NOT_APPLICABLE"
-    return True
-
-
-def get_hri_choises(answer):
-    logger.debug("%s" % json.dumps(answer, indent = 4))
-    logger.debug("%s" % answer["ChoiceAnswerSummaries"])
-    hri_choices = []
-    choice_id_risk_level_map = {}
-    choices = answer["Choices"]
-    for i, choice in enumerate(choices):
-        logger.debug("%s" % json.dumps(choice, indent = 4))
-        if choice["Title"] == "None of these":
-            continue
-        choice_id = choice["ChoiceId"]
-        url = "https://docs.aws.amazon.com/wellarchitected/{}/framework/{}.html".format(LENS_VERSION, choice_id)
-        risk_level = parse_web_page(url)
-        # logger.info("Q: %s\nChoice: %s\nDetected risk: %s\nLink: %s\n" % (answer["QuestionTitle"],
-        #                                                                 choice["Title"],
-        #                                                                 risk_level,
-        #                                                                 url))
-        logger.info("Detected risk: %s\nLink: %s\n" % (risk_level, url))
-        if risk_level is None:
-            # Exception?
-            logger.error("Could not find risk level on page: %s" % url)
-        # Check if the statement (choice) has a high risk level and is not selected as done (and not marked as `not applied`) 
-        else:
-            choice_answer_summaries = answer["ChoiceAnswerSummaries"]
-            if risk_level == 'High' and is_choice_applied(choice_id, choice_answer_summaries):
-                choice["RiskLevel"] = risk_level
-                choice["Selected"] = choice_id in answer["SelectedChoices"]
-                choice["Documention"] = url
-                hri_choices.append(choice)
-        choice_id_risk_level_map[choice_id] = risk_level
-    return hri_choices
+def get_choice_ids(answers):
+    choice_ids = []
+    for answer in answers:
+        for choice in answer["Choices"]:
+            if choice["Title"] != "None of these":
+                choice_ids.append(choice["ChoiceId"])
+    return choice_ids
 
 
-def create_tasks(
-        waclient,
-        workloadId,
-        lensAlias
-):
-    JIRA_WAS_DONE_TRANSITION_ID = None
-    tasks = []
-    for pillar in PILLAR_PARSE_MAP:
-        answers = []
-        logger.debug("Grabbing answers for %s %s" % (lensAlias, pillar))
-        # Find a questionID using the questionTitle
-        try:
-            response=waclient.list_answers(
-                WorkloadId=workloadId,
-                LensAlias=lensAlias,
-                PillarId=pillar
-            )
-        except botocore.exceptions.ParamValidationError as e:
-            logger.error("ERROR - Parameter validation error: %s" % e)
-        except botocore.exceptions.ClientError as e:
-            logger.error("ERROR - Unexpected error: %s" % e)
-
-        logger.debug("%s" % json.dumps(response, indent = 4))
-        answers.extend(response["AnswerSummaries"])
-        while "NextToken" in response:
-            try:
-                response = waclient.list_answers(WorkloadId=workloadId,
-                                                 LensAlias=lensAlias,
-                                                 PillarId=pillar,
-                                                 NextToken=response["NextToken"])
-            except botocore.exceptions.ParamValidationError as e:
-                logger.error("ERROR - Parameter validation error: %s" % e)
-            except botocore.exceptions.ClientError as e:
-                logger.error("ERROR - Unexpected error: %s" % e)
-            answers.extend(response["AnswerSummaries"])
-            logger.debug("response: %s" % json.dumps(response, indent = 4))
-            logger.debug("answers: %s" % json.dumps(answers, indent = 4))
-        applicable_answers=[]
-        for i, answer in enumerate(answers, start=1):
-            logger.debug("%s: %s's risk is %s" % (pillar, answer["QuestionId"], answer["Risk"]))
-            if answer["Risk"] != "NOT_APPLICABLE":
-                answer["Index"] = i
-                applicable_answers.append(answer)
-        logger.debug("%s" % json.dumps(applicable_answers, indent = 4))
-        for answer in applicable_answers:
-            logger.debug("%s: %s: %s" % (pillar, answer["QuestionId"], answer["Risk"]))
-            question_url = "https://docs.aws.amazon.com/wellarchitected/{}/framework/{}.html".format(
+def get_hri_table(answers, risk_level_map):
+    hri_table = evaluate_hri_choices(answers, risk_level_map, lambda choice_id: choice_page_url(LENS_VERSION, choice_id))
+    counts = hri_table.counts()
+    logger.info("%s HRI choices in %s questions, %s of them selected" % (counts["choices"],
+                                                                       counts["questions"],
+                                                                       counts["selected"]))
+    return hri_table
+
+
+def get_risk_level_map(answers, risk_level_index):
+    # WA question risks (with --riskSource wa-api) and the prebuilt index first,
+    # pages are scraped only for the choices they miss
+    risk_level_map = {}
+    missing = []
+    ruled_out = 0
+    for answer in answers:
+        selected = set(answer["SelectedChoices"])
+        for choice_id in get_choice_ids([answer]):
+            if RISK_SOURCE == "wa-api" and answer["Risk"] in ("MEDIUM", "NONE") and choice_id not in selected:
+                # WA rates a question HIGH as soon as one applicable High choice is not selected
+                risk_level_map[choice_id] = NOT_HIGH
+                ruled_out += 1
+            elif risk_level_index and choice_id in risk_level_index:
+                risk_level_map[choice_id] = risk_level_index[choice_id]
+            else:
+                missing.append(choice_id)
+    if ruled_out:
+        logger.info("%s choices are not High by the risk of their questions" % ruled_out)
+    if missing:
+        logger.info("%s choices are not in the risk level index, scraping their pages" % len(missing))
+        risk_level_map.update(resolve_risk_levels(missing, LENS_VERSION, DOC_WORKERS))
+    return risk_level_map
+
+
+def get_applicable_answers(answer_set, pillar):
+    applicable_answers=[]
+    for answer in answer_set.pillar(pillar):
+        logger.debug("%s: %s's risk is %s" % (pillar, answer["QuestionId"], answer["Risk"]))
+        if answer["Risk"] != "NOT_APPLICABLE":
+            applicable_answers.append(answer)
+    logger.debug("%s", LazyJson(applicable_answers))
+    return applicable_answers
+
+
+def question_page_url(pillar, answer):
+    return "https://docs.aws.amazon.com/wellarchitected/{}/framework/{}.html".format(
                                                                 LENS_VERSION,
                                                                 generate_question_page_name(
                                                                                             PILLAR_PARSE_MAP[pillar],
                                                                                             answer["Index"]
                                                                                         )
                                                             )
-            task_id=create_issue(email_address,
-                                 api_token,
-                                 "TASK",
-                                 "{}_pillar".format(pillar),
-                                 EPIC,
-                                 PROJ_KEY,
-                                 answer["QuestionTitle"],
-                                 question_url
+
+
+def moved_callback(journal, board_id):
+    if journal is None:
+        return None
+    return lambda issue_keys: journal.issues_moved(board_id, issue_keys)
+
+
+def get_was_done_transition_id(proj_key, issue_key, issue_type):
+    transition_id = get_transition_id(email_address,
+                                      api_token,
+                                      proj_key,
+                                      issue_type,
+                                      JIRA_WAS_DONE_TRANSITION_NAME,
+                                      issue_key)
+    if transition_id is None:
+        logger.error("Could not find transition with name '%s' for %s" % (JIRA_WAS_DONE_TRANSITION_NAME,
+                                                                          issue_key))
+    return transition_id
+
+
+def transit_in_bulk(proj_key, issue_type, issue_keys):
+    """Transits issues of one type with bulk requests, returns the set of the keys that were transited"""
+    transited = set(transit_issues(email_address,
+                                   api_token,
+                                   issue_keys,
+                                   get_was_done_transition_id(proj_key, issue_keys[0], issue_type)))
+    failed_keys = [issue_key for issue_key in issue_keys if issue_key not in transited]
+    if failed_keys:
+        # the cached ID may be outdated after a workflow change: look it up again and retry once
+        logger.warning("Transiting %s issues failed, refreshing the '%s' transition id" % (
+            len(failed_keys), JIRA_WAS_DONE_TRANSITION_NAME))
+        invalidate_transition_id(email_address, api_token, proj_key, issue_type, JIRA_WAS_DONE_TRANSITION_NAME)
+        transited.update(transit_issues(email_address,
+                                        api_token,
+                                        failed_keys,
+                                        get_was_done_transition_id(proj_key, failed_keys[0], issue_type)))
+    logger.info("Transited %s of %s %s issues in bulk" % (len(transited), len(issue_keys), issue_type))
+    return transited
+
+
+def create_journalled_issues(specs, journal, run_id, run_started):
+    """create_issues for `specs`, except for the ones a resumed run finds already created in Jira
+
+    The interrupted run may have died in the middle of a create, or given up on it after the last retry,
+    so Jira can hold issues of the run that never made it to the journal; they are found by their dedup label.
+    """
+    keys = {}
+    if journal is not None and journal.resumed and specs:
+        keys = find_issues_by_refs(email_address, api_token, specs, run_id, run_started)
+        if keys:
+            logger.info("Found %s issues created by the interrupted run, not creating them again" % len(keys))
+    missing = [spec for spec in specs if spec["ref"] not in keys]
+    keys.update(zip([spec["ref"] for spec in missing],
+                    create_issues(email_address, api_token, missing, run_id, run_started)))
+    return [keys[spec["ref"]] for spec in specs]
+
+def create_tasks(
+        waclient,
+        workloadId,
+        lensAlias,
+        proj_key,
+        epic,
+        board_id,
+        risk_level_index=None,
+        state=None,
+        journal=None
+):
+    # With `state` (sync mode) issues created by previous runs are reused, and only the issues and
+    # transitions missing from the state are written to Jira.
+    # With `journal` every completed write is logged, steps found in a resumed journal are skipped.
+    # Answers of all pillars are fetched at once, then the work runs as a pipeline of stages
+    # (answers -> risk levels -> tasks -> subtasks) that handle one pillar at a time each,
+    # so that waiting on the docs site and Jira overlaps. New tasks are moved to the board in the background.
+    # With --bulkTransitions the target status of every issue is known when it is created, and the issues are
+    # transited together by a transitions stage instead of one transit request per issue
+    pending_transitions = []
+    pending_lock = threading.Lock()
+    run_id, run_started = dedup_run(journal)
+    summary = {"workloadId": workloadId, "tasks": 0, "subtasks": 0, "transitions": 0, "moved": 0, "failed": 0}
+    summary_lock = threading.Lock()
+
+    def count(**counters):
+        with summary_lock:
+            for counter, value in counters.items():
+                summary[counter] += value
+    answer_set = fetch_answers(waclient, workloadId, lensAlias, PILLAR_PARSE_MAP)
+
+    def get_known_task(question_id):
+        known_task = state.get_task(workloadId, question_id) if state is not None else None
+        if known_task is None and journal is not None:
+            key = journal.get_created(task_ref(workloadId, question_id))
+            if key is not None:
+                known_task = {"key": key, "transited": False}
+        if known_task is not None and journal is not None:
+            known_task["transited"] = known_task["transited"] or journal.is_transited(known_task["key"])
+        return known_task
+
+    def get_known_subtask(question_id, choice_id):
+        known_subtask = state.get_subtask(workloadId, question_id, choice_id) if state is not None else None
+        if known_subtask is None and journal is not None:
+            key = journal.get_created(subtask_ref(workloadId, question_id, choice_id))
+            if key is not None:
+                known_subtask = {"key": key, "transited": False}
+        if known_subtask is not None and journal is not None:
+            known_subtask["transited"] = known_subtask["transited"] or journal.is_transited(known_subtask["key"])
+        return known_subtask
+
+    def transit(issue_key, issue_type):
+        status_code = transit_issue(email_address,
+                                    api_token,
+                                    issue_key,
+                                    get_was_done_transition_id(proj_key, issue_key, issue_type)
+        )
+        if status_code == 400:
+            # the cached ID may be outdated after a workflow change: look it up again on this issue
+            logger.warning("Transiting %s failed, refreshing the '%s' transition id" % (issue_key,
+                                                                                      JIRA_WAS_DONE_TRANSITION_NAME))
+            invalidate_transition_id(email_address, api_token, proj_key, issue_type, JIRA_WAS_DONE_TRANSITION_NAME)
+            status_code = transit_issue(email_address,
+                                        api_token,
+                                        issue_key,
+                                        get_was_done_transition_id(proj_key, issue_key, issue_type)
             )
-            logger.debug("issue_id=create_issue(%s, %s, %s, %s, %s, %s)" % (email_address,
-                                                                            api_token,
-                                                                            "TASK",
-                                                                            EPIC,
-                                                                            PROJ_KEY,
-                                                                            answer["QuestionTitle"]))
-            logger.debug("%s created" % task_id)
-            logger.debug("creating issues")
-            if JIRA_WAS_DONE_TRANSITION_ID is None:
-                logger.info("JIRA_WAS_DONE_TRANSITION_ID is not defined, requesting transition id")
-                JIRA_WAS_DONE_TRANSITION_ID = get_transition_id_by_name(
-                    email_address,
-                    api_token,
-                    task_id,
-                    JIRA_WAS_DONE_TRANSITION_NAME
-                )
-                logger.info("JIRA_WAS_DONE_TRANSITION_ID = %s" % JIRA_WAS_DONE_TRANSITION_ID)
-                if JIRA_WAS_DONE_TRANSITION_ID is None:
-                    logger.error("Could not find transition with name '%s' for %s" % (JIRA_WAS_DONE_TRANSITION_NAME,
-                                                                                      task_id))
+        if status_code < 300:
+            count(transitions=1)
+            if journal is not None:
+                journal.issue_transited(issue_key)
+        else:
+            count(failed=1)
+        return status_code
+
+    def add_pending_transition(issue_type, issue_key, question_id, choice_id):
+        # added by the tasks and subtasks stages once the issue is in the state, taken by the transitions stage
+        with pending_lock:
+            pending_transitions.append((issue_type, issue_key, question_id, choice_id))
+
+    def transit_pending():
+        with pending_lock:
+            batch, pending_transitions[:] = pending_transitions[:], []
+        # pending transitions grouped by issue type, as the transition ID depends on it
+        by_issue_type = {}
+        for issue_type, issue_key, question_id, choice_id in batch:
+            by_issue_type.setdefault(issue_type, []).append((issue_key, question_id, choice_id))
+        for issue_type, issues in by_issue_type.items():
+            transited = transit_in_bulk(proj_key, issue_type, [issue[0] for issue in issues])
+            for issue_key, question_id, choice_id in issues:
+                if issue_key not in transited:
+                    count(failed=1)
+                    continue
+                count(transitions=1)
+                if journal is not None:
+                    journal.issue_transited(issue_key)
+                if state is not None:
+                    state.set_transited(workloadId, question_id, choice_id)
+        if state is not None:
+            state.save()
+
+    # created tasks are queued for the board as soon as they exist, and moved in the background
+    board_queue = None
+    if not ARGUMENTS.doNotMoveToBoard:
+        board_queue = board_move_queue(email_address, api_token, board_id, moved_callback(journal, board_id))
+
+    def list_answers_stage(pillar):
+        return {"pillar": pillar, "answers": get_applicable_answers(answer_set, pillar)}
+
+    def resolve_risk_levels_stage(item):
+        item["hri_table"] = get_hri_table(item["answers"], get_risk_level_map(item["answers"], risk_level_index))
+        return item
+
+    def create_tasks_stage(item):
+        # all tasks of the pillar in bulk
+        pillar = item["pillar"]
+        applicable_answers = item["answers"]
+        task_specs = []
+        new_answers = []
+        for answer in applicable_answers:
+            logger.debug("%s: %s: %s" % (pillar, answer["QuestionId"], answer["Risk"]))
+            if get_known_task(answer["QuestionId"]) is not None:
+                continue
+            task_specs.append({"issue_type": "TASK",
+                               "pillar_label": "{}_pillar".format(pillar),
+                               "parent": epic,
+                               "proj_key": proj_key,
+                               "summary": answer["QuestionTitle"],
+                               "link": question_page_url(pillar, answer),
+                               "ref": task_ref(workloadId, answer["QuestionId"])})
+            new_answers.append(answer)
+        logger.debug("creating %s tasks for %s" % (len(task_specs), pillar))
+        created_task_ids = dict(zip([answer["QuestionId"] for answer in new_answers],
+                                    create_journalled_issues(task_specs, journal, run_id, run_started)))
+        task_ids = []
+        new_tasks = []
+        for answer in applicable_answers:
+            transited = False
+            if answer["QuestionId"] in created_task_ids:
+                task_id = created_task_ids[answer["QuestionId"]]
+                if task_id is None:
+                    logger.error("Task for `%s` was not created, skipping its subtasks" % answer["QuestionId"])
+                    count(failed=1)
+                    task_ids.append(None)
+                    continue
+                logger.debug("%s created" % task_id)
+                count(tasks=1)
+                if journal is not None:
+                    journal.issue_created(task_ref(workloadId, answer["QuestionId"]), task_id)
+                new_tasks.append(task_id)
+            else:
+                known_task = get_known_task(answer["QuestionId"])
+                task_id = known_task["key"]
+                transited = known_task["transited"]
+                if journal is not None and journal.get_created(task_ref(workloadId, answer["QuestionId"])) == task_id \
+                        and not journal.is_moved(task_id):
+                    new_tasks.append(task_id)
+                if transited and answer["Risk"] == "HIGH":
+                    logger.warning("%s was transited, but the risk of `%s` is HIGH again" % (task_id,
+                                                                                            answer["QuestionId"]))
+            task_ids.append(task_id)
             logger.info("Applicable answer id = %s, task id = %s, risk level = %s" % (answer["QuestionId"],
                                                                                       task_id,
                                                                                       answer["Risk"]))
-            if answer["Risk"] != "HIGH":
+            pending = answer["Risk"] != "HIGH" and not transited and BULK_TRANSITIONS
+            if answer["Risk"] != "HIGH" and not transited and not BULK_TRANSITIONS:
                 logger.info("Transiting %s since all HRI choices of `%s` were selected" % (task_id,
                                                                                            answer["QuestionId"]))
-                status_code = transit_issue(email_address,
-                                            api_token,
-                                            task_id,
-                                            JIRA_WAS_DONE_TRANSITION_ID
-                )
+                status_code = transit(task_id, "TASK")
                 logger.info("Transiting %s: status code is %s" % (task_id, status_code))
-            tasks.append(task_id)
-            if len(tasks) == 50 and not ARGUMENTS.doNotMoveToBoard:
-                status_code = move_issues_to_board(
-                              email_address,
-                              api_token,
-                              BOARD_ID,
-                              tasks
-                )
-                logger.info("Moving 50 issues to the Jira Board with ID==%s: status code is %s" % (BOARD_ID, status_code))
-                tasks = []
-            hri_choices = get_hri_choises(answer)
-            logger.debug("%s (%s), choices:\n%s\n\nHRI choices:\n%s\n\n" % (answer["QuestionTitle"],
-                                                                           task_id,
-                                                                           json.dumps(answer["Choices"], indent = 4),
-                                                                           json.dumps(hri_choices, indent = 4)
-                                                                           ))
+                transited = status_code < 300
+            if state is not None:
+                state.set_task(workloadId, answer["QuestionId"], task_id, answer["Risk"],
+                               answer["SelectedChoices"], transited)
+            if pending:
+                add_pending_transition("TASK", task_id, answer["QuestionId"], None)
+        if state is not None:
+            state.save()
+        item["task_ids"] = task_ids
+        if board_queue is not None:
+            board_queue.add(new_tasks)
+        return item
+
+    def create_subtasks_stage(item):
+        # all subtasks of the pillar in bulk, under their resolved parent tasks
+        pillar = item["pillar"]
+        subtask_specs = []
+        subtask_choices = []
+        known_subtasks = []
+        for answer, task_id in zip(item["answers"], item["task_ids"]):
+            if task_id is None:
+                continue
+            hri_choices = item["hri_table"].question(answer["QuestionId"])
+            logger.debug("%s (%s), choices:\n%s\n\nHRI choices:\n%s\n\n", answer["QuestionTitle"],
+                                                                       task_id,
+                                                                       LazyJson(answer["Choices"]),
+                                                                       LazyJson(hri_choices))
             for choice in hri_choices:
-                subtask_id=create_issue(email_address,
-                                        api_token,
-                                        "SUBTASK",
-                                        "{}_pillar".format(pillar),
-                                        task_id,
-                                        PROJ_KEY,
-                                        choice["Title"],
-                                        choice["Documention"]
-                )
-                logger.debug("%s created" % subtask_id)
-                if choice["Selected"]:
-                    status_code = transit_issue(email_address,
-                                                api_token,
-                                                subtask_id,
-                                                JIRA_WAS_DONE_TRANSITION_ID
-                    )
-                    logger.debug("Transiting %s: status code is %s" % (subtask_id, status_code))
-        
-        # logger.debug("%s" % (json.dumps(applicable_answers, indent = 4)))
+                known_subtask = get_known_subtask(answer["QuestionId"], choice["ChoiceId"])
+                if known_subtask is not None:
+                    known_subtasks.append((choice, known_subtask))
+                    continue
+                subtask_specs.append({"issue_type": "SUBTASK",
+                                      "pillar_label": "{}_pillar".format(pillar),
+                                      "parent": task_id,
+                                      "proj_key": proj_key,
+                                      "summary": choice["Title"],
+                                      "link": choice["Documention"],
+                                      "ref": subtask_ref(workloadId, answer["QuestionId"], choice["ChoiceId"])})
+                subtask_choices.append(choice)
+        subtask_ids = create_journalled_issues(subtask_specs, journal, run_id, run_started)
+        subtasks = []
+        for choice, subtask_id in zip(subtask_choices, subtask_ids):
+            if subtask_id is None:
+                count(failed=1)
+                continue
+            logger.debug("%s created" % subtask_id)
+            count(subtasks=1)
+            if journal is not None:
+                journal.issue_created(subtask_ref(workloadId, choice["QuestionId"], choice["ChoiceId"]), subtask_id)
+            subtasks.append((choice, {"key": subtask_id, "transited": False}))
+        for choice, subtask in subtasks + known_subtasks:
+            subtask_id = subtask["key"]
+            transited = subtask["transited"]
+            if transited and not choice["Selected"]:
+                logger.warning("%s was transited, but `%s` is not selected anymore" % (subtask_id,
+                                                                                      choice["ChoiceId"]))
+            pending = choice["Selected"] and not transited and BULK_TRANSITIONS
+            if choice["Selected"] and not transited and not BULK_TRANSITIONS:
+                status_code = transit(subtask_id, "SUBTASK")
+                logger.debug("Transiting %s: status code is %s" % (subtask_id, status_code))
+                transited = status_code < 300
+            if state is not None:
+                state.set_subtask(workloadId, choice["QuestionId"], choice["ChoiceId"], subtask_id,
+                                  choice["Selected"], transited)
+            if pending:
+                add_pending_transition("SUBTASK", subtask_id, choice["QuestionId"], choice["ChoiceId"])
+        if state is not None:
+            state.save()
+        return item
+
+    def transit_stage(item):
+        if len(pending_transitions) >= BULK_TRANSITION_LIMIT:
+            transit_pending()
+        return item
+
+    def finish_transitions():
+        if pending_transitions:
+            transit_pending()
+
+    def finish_board_moves():
+        moved, failed = board_queue.flush()
+        logger.info("Moved %s tasks to the Jira Board with ID==%s, %s could not be moved" % (len(moved), board_id,
+                                                                                           len(failed)))
+        count(moved=len(moved), failed=len(failed))
+
+    stages = [
+        ("answers", list_answers_stage, None),
+        ("risk-levels", resolve_risk_levels_stage, None),
+        ("tasks", create_tasks_stage, None),
+        ("subtasks", create_subtasks_stage, None)
+    ]
+    if BULK_TRANSITIONS:
+        stages.append(("transitions", transit_stage, finish_transitions))
+    try:
+        Pipeline(stages, PIPELINE_QUEUE_SIZE).run(PILLAR_PARSE_MAP)
+    finally:
+        # the tasks that were created are moved even if the run stopped half way
+        if board_queue is not None:
+            finish_board_moves()
+    return summary
+
+def plan_workload(
+        waclient,
+        workloadId,
+        lensAlias,
+        proj_key,
+        epic,
+        board_id,
+        risk_level_index=None,
+        state=None
+):
+    # The whole analysis of create_tasks, without any Jira call: the issues, transitions and board moves
+    # it would make. With `state` the issues created by previous runs are planned as existing ones
+    answer_set = fetch_answers(waclient, workloadId, lensAlias, PILLAR_PARSE_MAP)
+    answers_by_pillar = {pillar: get_applicable_answers(answer_set, pillar) for pillar in PILLAR_PARSE_MAP}
+    all_answers = [answer for answers in answers_by_pillar.values() for answer in answers]
+    hri_table = get_hri_table(all_answers, get_risk_level_map(all_answers, risk_level_index))
+    tasks = []
+    for pillar, answers in answers_by_pillar.items():
+        for answer in answers:
+            known_task = state.get_task(workloadId, answer["QuestionId"]) if state is not None else None
+            transited = known_task is not None and known_task["transited"]
+            task = {"ref": task_ref(workloadId, answer["QuestionId"]),
+                    "questionId": answer["QuestionId"],
+                    "pillar": pillar,
+                    "summary": answer["QuestionTitle"],
+                    "link": question_page_url(pillar, answer),
+                    "risk": answer["Risk"],
+                    "selectedChoices": answer["SelectedChoices"],
+                    "key": known_task["key"] if known_task is not None else None,
+                    "transited": transited,
+                    "transit": answer["Risk"] != "HIGH" and not transited,
+                    "moveToBoard": known_task is None and not ARGUMENTS.doNotMoveToBoard,
+                    "subtasks": []}
+            for choice in hri_table.question(answer["QuestionId"]):
+                known_subtask = state.get_subtask(workloadId, answer["QuestionId"], choice["ChoiceId"]) \
+                    if state is not None else None
+                transited = known_subtask is not None and known_subtask["transited"]
+                task["subtasks"].append({"ref": subtask_ref(workloadId, answer["QuestionId"], choice["ChoiceId"]),
+                                         "choiceId": choice["ChoiceId"],
+                                         "summary": choice["Title"],
+                                         "link": choice["Documention"],
+                                         "selected": choice["Selected"],
+                                         "key": known_subtask["key"] if known_subtask is not None else None,
+                                         "transited": transited,
+                                         "transit": choice["Selected"] and not transited})
+            tasks.append(task)
+    return {"workloadId": workloadId,
+            "jiraProject": proj_key,
+            "jiraEpic": epic,
+            "jiraBoard": board_id,
+            "tasks": tasks}
+
 
+def apply_plan(workload_plan, state=None, journal=None):
+    # Executes the plan of a workload in as few requests as possible: all tasks in bulk, then all subtasks,
+    # then bulk transitions per issue type; board moves run in the background from the moment the tasks exist.
+    # Steps found in `journal` are skipped
+    workloadId = workload_plan["workloadId"]
+    proj_key = workload_plan["jiraProject"]
+    board_id = workload_plan["jiraBoard"]
+    summary = {"workloadId": workloadId, "tasks": 0, "subtasks": 0, "transitions": 0, "moved": 0, "failed": 0}
+    keys = {}
+    run_id, run_started = dedup_run(journal)
+
+    def known_key(issue):
+        if issue["key"] is None and journal is not None:
+            return journal.get_created(issue["ref"])
+        return issue["key"]
+
+    def create(issue_type, issues, specs):
+        for issue, key in zip(issues, create_journalled_issues(specs, journal, run_id, run_started)):
+            if key is None:
+                logger.error("Issue for `%s` was not created" % issue["ref"])
+                summary["failed"] += 1
+                continue
+            keys[issue["ref"]] = key
+            summary["tasks" if issue_type == "TASK" else "subtasks"] += 1
+            if journal is not None:
+                journal.issue_created(issue["ref"], key)
+
+    new_tasks = []
+    task_specs = []
+    for task in workload_plan["tasks"]:
+        keys[task["ref"]] = known_key(task)
+        if keys[task["ref"]] is None:
+            new_tasks.append(task)
+            task_specs.append({"issue_type": "TASK",
+                               "pillar_label": "{}_pillar".format(task["pillar"]),
+                               "parent": workload_plan["jiraEpic"],
+                               "proj_key": proj_key,
+                               "summary": task["summary"],
+                               "link": task["link"],
+                               "ref": task["ref"]})
+    logger.info("Creating %s tasks of %s" % (len(task_specs), workloadId))
+    create("TASK", new_tasks, task_specs)
+    # -n given at apply time overrides the moves of the plan
+    board_queue = None
     if not ARGUMENTS.doNotMoveToBoard:
-        status_code = move_issues_to_board(
-                        email_address,
-                        api_token,
-                        BOARD_ID,
-                        tasks
-        )
-        logger.info("Moving remaining %s tasks to the Jira Board with ID==%s: status code is %s" % (len(tasks),
-                                                                                                   BOARD_ID,
-                                                                                                   status_code))
+        board_queue = board_move_queue(email_address, api_token, board_id, moved_callback(journal, board_id))
+        board_queue.add([keys[task["ref"]] for task in workload_plan["tasks"]
+                         if task["moveToBoard"] and keys.get(task["ref"]) is not None
+                         and not (journal is not None and journal.is_moved(keys[task["ref"]]))])
+
+    new_subtasks = []
+    subtask_specs = []
+    for task in workload_plan["tasks"]:
+        if keys.get(task["ref"]) is None:
+            continue
+        for subtask in task["subtasks"]:
+            keys[subtask["ref"]] = known_key(subtask)
+            if keys[subtask["ref"]] is None:
+                new_subtasks.append(subtask)
+                subtask_specs.append({"issue_type": "SUBTASK",
+                                      "pillar_label": "{}_pillar".format(task["pillar"]),
+                                      "parent": keys[task["ref"]],
+                                      "proj_key": proj_key,
+                                      "summary": subtask["summary"],
+                                      "link": subtask["link"],
+                                      "ref": subtask["ref"]})
+    logger.info("Creating %s subtasks of %s" % (len(subtask_specs), workloadId))
+    create("SUBTASK", new_subtasks, subtask_specs)
 
-def main():
+    transited = set()
+    by_issue_type = {"TASK": [], "SUBTASK": []}
+    for task in workload_plan["tasks"]:
+        for issue_type, issue in [("TASK", task)] + [("SUBTASK", subtask) for subtask in task["subtasks"]]:
+            key = keys.get(issue["ref"])
+            if key is None or not issue["transit"]:
+                continue
+            if journal is not None and journal.is_transited(key):
+                transited.add(key)
+                continue
+            by_issue_type[issue_type].append(key)
+    for issue_type, issue_keys in by_issue_type.items():
+        if not issue_keys:
+            continue
+        done = transit_in_bulk(proj_key, issue_type, issue_keys)
+        summary["transitions"] += len(done)
+        summary["failed"] += len(issue_keys) - len(done)
+        for key in done:
+            if journal is not None:
+                journal.issue_transited(key)
+        transited.update(done)
+
+    if board_queue is not None:
+        moved, failed = board_queue.flush()
+        logger.info("Moved %s tasks to the Jira Board with ID==%s, %s could not be moved" % (len(moved), board_id,
+                                                                                           len(failed)))
+        summary["moved"] += len(moved)
+        summary["failed"] += len(failed)
+
+    if state is not None:
+        for task in workload_plan["tasks"]:
+            task_key = keys.get(task["ref"])
+            if task_key is None:
+                continue
+            state.set_task(workloadId, task["questionId"], task_key, task["risk"], task["selectedChoices"],
+                           task["transited"] or task_key in transited)
+            for subtask in task["subtasks"]:
+                subtask_key = keys.get(subtask["ref"])
+                if subtask_key is not None:
+                    state.set_subtask(workloadId, task["questionId"], subtask["choiceId"], subtask_key,
+                                      subtask["selected"], subtask["transited"] or subtask_key in transited)
+        state.save()
+    return summary
+
+def main(argv=None):
     """ Main program run """
 
-    boto3_min_version = "1.16.38"
-    # Verify if the version of Boto3 we are running has the wellarchitected APIs included
-    if packaging.version.parse(boto3.__version__) < packaging.version.parse(boto3_min_version):
-        logger.error("Your Boto3 version (%s) is less than %s. You must ugprade to run this script (pip3 upgrade boto3)" % (boto3.__version__, boto3_min_version))
-        sys.exit()
-
-    logger.info("Starting Boto %s Session" % boto3.__version__)
-
-    # Create a new boto3 session
-    SESSION1 = boto3.session.Session(aws_access_key_id=aws_access_key_id,
-                                     aws_secret_access_key=aws_secret_access_key,
-                                     aws_session_token=aws_session_token)
-    WACLIENT = SESSION1.client(
-        service_name='wellarchitected',
-        region_name=REGION
-    )
-    create_tasks(WACLIENT, WORKLOAD_ID, LENS_ALIAS)
+    configure(parse_arguments(argv))
+    setup_logging(ARGUMENTS.debug)
+    configure_sampling(ARGUMENTS.debugSampleSize)
+    configure_metadata_cache(JIRA_CACHE_FILE, JIRA_CACHE_TTL)
+    configure_scheduler(JIRA_RATE_LIMIT, JIRA_MAX_RETRIES)
+    configure_timeout(JIRA_CONNECT_TIMEOUT, JIRA_READ_TIMEOUT)
+    state = SyncState(STATE_FILE) if SYNC else None
+    page_cache = None
+    if APPLY_FILE:
+        # the plan holds everything the writes need, neither WA nor the documentation is read
+        read_credentials(require_aws=False)
+        plan = load_plan(APPLY_FILE)
+        workloads = plan["workloads"]
+        lens_version = plan["lensVersion"]
+        logger.info("Applying plan %s of %s workloads created at %s" % (APPLY_FILE, len(workloads), plan["createdAt"]))
+    else:
+        if BATCH_FILE:
+            with open(BATCH_FILE) as f:
+                workloads = json.load(f)
+        elif FROM_SNAPSHOT:
+            workloads = [{"workloadId": WORKLOAD_ID or load_snapshot(FROM_SNAPSHOT)["workloadId"],
+                          "jiraProject": PROJ_KEY, "jiraEpic": EPIC, "jiraBoard": BOARD_ID, "snapshot": FROM_SNAPSHOT}]
+        else:
+            workloads = [{"workloadId": WORKLOAD_ID, "jiraProject": PROJ_KEY, "jiraEpic": EPIC, "jiraBoard": BOARD_ID}]
+        from_snapshots = all(workload.get("snapshot") for workload in workloads)
+        read_credentials(require_aws=not from_snapshots, require_jira=not PLAN_FILE)
+        if from_snapshots:
+            logger.info("Answers are taken from snapshots, AWS is not called")
+            WACLIENT = None
+        else:
+            import boto3
+            # Verify if the version of Boto3 we are running has the wellarchitected APIs included
+            if version_tuple(boto3.__version__) < version_tuple(BOTO3_MIN_VERSION):
+                logger.error("Your Boto3 version (%s) is less than %s. You must ugprade to run this script (pip3 upgrade boto3)" % (boto3.__version__, BOTO3_MIN_VERSION))
+                sys.exit()
+
+            logger.info("Starting Boto %s Session" % boto3.__version__)
+
+            # Create a new boto3 session
+            SESSION1 = boto3.session.Session(aws_access_key_id=aws_access_key_id,
+                                             aws_secret_access_key=aws_secret_access_key,
+                                             aws_session_token=aws_session_token)
+            WACLIENT = create_wa_client(SESSION1, REGION)
+        page_cache = configure_page_cache(DOC_CACHE_DIR, DOC_CACHE_MAX_SIZE, DOC_CACHE_MAX_AGE, OFFLINE)
+        configure_rate_limit(DOC_RATE_LIMIT)
+        risk_level_index = load_risk_level_index(LENS_VERSION, RISK_INDEX_DIR) if RISK_SOURCE != "scrape" else {}
+        if risk_level_index:
+            logger.info("Loaded %s risk levels of lens version %s from the index" % (len(risk_level_index), LENS_VERSION))
+        elif RISK_SOURCE != "scrape":
+            logger.warning("No risk level index for lens version %s, every choice page will be scraped" % LENS_VERSION)
+        lens_version = LENS_VERSION
+
+    def workload_wa_client(workload):
+        if workload.get("snapshot"):
+            return SnapshotClient(load_snapshot(workload["snapshot"]))
+        return WACLIENT
+
+    def report_requests():
+        if page_cache is not None:
+            logger.info("Documentation cache: %s hits, %s revalidated, %s fetched" % (page_cache.hits,
+                                                                                    page_cache.revalidated,
+                                                                                    page_cache.misses))
+        logger.info("Requests of the run:\n%s" % metrics.summary_table())
+        if METRICS_FILE:
+            metrics.write(METRICS_FILE, METRICS_FORMAT)
+
+    if PLAN_FILE:
+        plan = new_plan(LENS_VERSION)
+        with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+            plan["workloads"] = list(executor.map(lambda workload: plan_workload(workload_wa_client(workload),
+                                                                                 workload["workloadId"],
+                                                                                 LENS_ALIAS,
+                                                                                 workload["jiraProject"],
+                                                                                 workload["jiraEpic"],
+                                                                                 workload.get("jiraBoard", BOARD_ID),
+                                                                                 risk_level_index,
+                                                                                 state),
+                                                  workloads))
+        save_plan(PLAN_FILE, plan)
+        for workload_plan in plan["workloads"]:
+            counts = plan_counts(workload_plan)
+            logger.info("%s: %s tasks and %s subtasks to create, %s transitions, %s board moves" % (
+                workload_plan["workloadId"], counts["tasks"], counts["subtasks"], counts["transitions"],
+                counts["moves"]))
+        logger.info("Plan written to %s, run with --apply %s to make the changes in Jira" % (PLAN_FILE, PLAN_FILE))
+        report_requests()
+        return
+
+    def run_workload(workload):
+        journal_file = JOURNAL_FILE
+        if len(workloads) > 1 or BATCH_FILE:
+            journal_file = "{}-{}{}".format(os.path.splitext(JOURNAL_FILE)[0],
+                                            workload["workloadId"],
+                                            os.path.splitext(JOURNAL_FILE)[1])
+        journal = RunJournal(journal_file, RESUME)
+        try:
+            journal.start(workloadId=workload["workloadId"],
+                          project=workload["jiraProject"],
+                          epic=workload["jiraEpic"],
+                          lensVersion=lens_version)
+            if APPLY_FILE:
+                return apply_plan(workload, state, journal)
+            return create_tasks(workload_wa_client(workload),
+                                workload["workloadId"],
+                                LENS_ALIAS,
+                                workload["jiraProject"],
+                                workload["jiraEpic"],
+                                workload.get("jiraBoard", BOARD_ID),
+                                risk_level_index,
+                                state,
+                                journal)
+        finally:
+            journal.close()
+
+    summaries = []
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        futures = {executor.submit(run_workload, workload): workload for workload in workloads}
+        for future in as_completed(futures):
+            workload_id = futures[future]["workloadId"]
+            try:
+                summaries.append(future.result())
+            except Exception as e:
+                logger.error("ERROR - Workload %s failed: %s" % (workload_id, e))
+                summaries.append({"workloadId": workload_id, "error": str(e)})
+    totals = {"tasks": 0, "subtasks": 0, "transitions": 0, "moved": 0, "failed": 0}
+    for summary in summaries:
+        if "error" in summary:
+            logger.info("%s: FAILED (%s)" % (summary["workloadId"], summary["error"]))
+            continue
+        logger.info("%s: %s tasks, %s subtasks, %s transitions, %s moved to board, %s failed writes" % (
+            summary["workloadId"], summary["tasks"], summary["subtasks"], summary["transitions"],
+            summary["moved"], summary["failed"]))
+        for counter in totals:
+            totals[counter] += summary[counter]
+    logger.info("Total for %s workloads (%s failed): %s tasks, %s subtasks, %s transitions, %s moved to board, %s failed writes" % (
+        len(summaries), len([summary for summary in summaries if "error" in summary]), totals["tasks"],
+        totals["subtasks"], totals["transitions"], totals["moved"], totals["failed"]))
     logger.info("All applicable HRI answers and choices imported to Jira tasks and subtasks.")
+    stats = connection_stats(email_address, api_token)
+    logger.info("Jira connections: %s requests sent, %s connections opened, %s reused" % (stats["requests"],
+                                                                                        stats["opened"],
+                                                                                        stats["reused"]))
+    stats = issue_type_cache_stats(email_address, api_token)
+    logger.info("Jira issue type cache: %s hits, %s misses" % (stats["hits"], stats["misses"]))
+    stats = transition_cache_stats(email_address, api_token)
+    logger.info("Jira transition cache: %s hits, %s misses" % (stats["hits"], stats["misses"]))
+    stats = scheduler_stats(email_address, api_token)
+    logger.info("Jira scheduler: %s retries, %s throttled responses, final rate %s requests/s" % (stats["retries"],
+                                                                                                 stats["throttled"],
+                                                                                                 stats["rate"]))
+    report_requests()
 
 
 
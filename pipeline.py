@@ -0,0 +1,82 @@
+import queue
+import threading
+
+DEFAULT_QUEUE_SIZE = 2
+
+_END = object()
+
+
+class Pipeline:
+    """Runs every stage in its own thread, connected with bounded queues, so that the stages overlap
+
+    A stage is a (name, process, finish) tuple: `process` takes an item of the previous stage and returns
+    the item for the next one, or None to pass nothing on; `finish` (can be None) is called once the
+    previous stage is done, and its result, if not None, is passed on as the last item.
+    The first exception raised by a stage stops the pipeline and is raised again by `run`.
+    """
+
+    def __init__(self, stages, queue_size=DEFAULT_QUEUE_SIZE):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.error = None
+        self.failed = threading.Event()
+
+    def run(self, items):
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0]), name="pipeline-source", daemon=True)]
+        for i, stage in enumerate(self.stages):
+            threads.append(threading.Thread(target=self._work, args=(stage, queues[i], queues[i + 1]),
+                                            name="pipeline-{}".format(stage[0]), daemon=True))
+        for thread in threads:
+            thread.start()
+        results = []
+        while True:
+            item = queues[-1].get()
+            if item is _END:
+                break
+            results.append(item)
+        for thread in threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+        return results
+
+    def _feed(self, items, out_queue):
+        try:
+            for item in items:
+                if self.failed.is_set():
+                    break
+                out_queue.put(item)
+        except Exception as e:
+            self._fail(e)
+        out_queue.put(_END)
+
+    def _work(self, stage, in_queue, out_queue):
+        name, process, finish = stage
+        while True:
+            item = in_queue.get()
+            if item is _END:
+                break
+            if self.failed.is_set():
+                # keep draining so that the upstream stages are not blocked on a full queue
+                continue
+            try:
+                result = process(item)
+            except Exception as e:
+                self._fail(e)
+                continue
+            if result is not None:
+                out_queue.put(result)
+        if finish is not None and not self.failed.is_set():
+            try:
+                result = finish()
+                if result is not None:
+                    out_queue.put(result)
+            except Exception as e:
+                self._fail(e)
+        out_queue.put(_END)
+
+    def _fail(self, error):
+        if not self.failed.is_set():
+            self.error = error
+            self.failed.set()
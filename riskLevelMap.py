@@ -1,3 +1,12 @@
+import json
+import os
+
+RISK_LEVEL_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "riskLevelIndex")
+# Index files keep one letter per risk level to stay small
+RISK_LEVEL_CODES = {"High": "H", "Medium": "M", "Low": "L"}
+# Risk level of a choice that is known not to be High, without telling whether it is Medium or Low
+NOT_HIGH = "Not High"
+
 CHOICE_ID_RISK_LEVEL_MAP = {
                     "ops_priorities_ext_cust_needs": "High",
                     "ops_priorities_int_cust_needs": "High",
@@ -68,4 +77,30 @@ CHOICE_ID_RISK_LEVEL_MAP = {
                     "ops_evolve_ops_metrics_review": "Medium",
                     "ops_evolve_ops_share_lessons_learned": "Low",
                     "ops_evolve_ops_allocate_time_for_imp": "Low",
-}
\ No newline at end of file
+}
+
+
+def risk_level_index_path(lens_version, index_dir=RISK_LEVEL_INDEX_DIR):
+    return os.path.join(index_dir, "{}.json".format(lens_version))
+
+def load_risk_level_index(lens_version, index_dir=RISK_LEVEL_INDEX_DIR):
+    """Returns choice_id -> risk level map prebuilt for `lens_version`, empty if there is no index for it"""
+    path = risk_level_index_path(lens_version, index_dir)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        index = json.load(f)
+    levels = {code: level for level, code in RISK_LEVEL_CODES.items()}
+    return {choice_id: levels[code] for choice_id, code in index["levels"].items()}
+
+def save_risk_level_index(lens_version, risk_level_map, generated_at, index_dir=RISK_LEVEL_INDEX_DIR):
+    os.makedirs(index_dir, exist_ok=True)
+    index = {
+        "lensVersion": lens_version,
+        "generatedAt": generated_at,
+        "levels": {choice_id: RISK_LEVEL_CODES[level] for choice_id, level in sorted(risk_level_map.items())}
+    }
+    path = risk_level_index_path(lens_version, index_dir)
+    with open(path, "w") as f:
+        json.dump(index, f, separators=(",", ":"))
+    return path
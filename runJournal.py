@@ -0,0 +1,98 @@
+import json
+import os
+import threading
+import time
+import uuid
+
+
+class RunJournal:
+    """Append-only JSON lines log of the Jira writes of a create_tasks run
+
+    Every created issue, applied transition and board move is appended as soon as Jira confirmed it.
+    Opened with `resume`, the journal of the interrupted run is replayed so that the run can skip the
+    steps that were already completed and continue from the first incomplete one.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.created = {}
+        self.transited = set()
+        self.moved = set()
+        self.started = None
+        # set by start() when the journal continues an interrupted run
+        self.resumed = False
+        # identifies the run in the dedup labels of the issues it creates, kept when the run is resumed
+        self.run_id = None
+        self.run_started = None
+        if resume and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        self._replay(json.loads(line))
+                    except ValueError:
+                        # the last line may be cut short by the failure the run is resumed from
+                        break
+        self.file = open(path, "a" if resume else "w")
+
+    def _replay(self, event):
+        if event["event"] == "started":
+            self.started = event
+            self.run_id = event.get("runId") or uuid.uuid4().hex
+            self.run_started = event.get("runStarted", time.time())
+        elif event["event"] == "created":
+            self.created[event["ref"]] = event["key"]
+        elif event["event"] == "transited":
+            self.transited.add(event["key"])
+        elif event["event"] == "moved":
+            self.moved.update(event["keys"])
+
+    def record(self, event):
+        with self.lock:
+            self._replay(event)
+            self.file.write("{}\n".format(json.dumps(event)))
+            self.file.flush()
+
+    def start(self, **run):
+        # a journal can only be resumed by a run with the same workload and Jira target
+        if self.started is not None:
+            started = {k: v for k, v in self.started.items() if k not in ("event", "runId", "runStarted")}
+            if started != run:
+                raise ValueError("Journal {} belongs to another run: {}".format(self.path, started))
+            self.resumed = True
+            return
+        self.record(dict(event="started", runId=uuid.uuid4().hex, runStarted=time.time(), **run))
+
+    def issue_created(self, ref, key):
+        self.record({"event": "created", "ref": ref, "key": key})
+
+    def issue_transited(self, key):
+        self.record({"event": "transited", "key": key})
+
+    def issues_moved(self, board_id, keys):
+        self.record({"event": "moved", "board": board_id, "keys": keys})
+
+    def get_created(self, ref):
+        return self.created.get(ref)
+
+    def is_transited(self, key):
+        return key in self.transited
+
+    def is_moved(self, key):
+        return key in self.moved
+
+    def close(self):
+        self.file.close()
+
+
+def task_ref(workload_id, question_id):
+    return "TASK|{}|{}".format(workload_id, question_id)
+
+def subtask_ref(workload_id, question_id, choice_id):
+    return "SUBTASK|{}|{}|{}".format(workload_id, question_id, choice_id)
+
+def dedup_run(journal):
+    """(run id, start time) the dedup labels of a run are made from: the journal's, or new ones without a journal"""
+    if journal is not None and journal.run_id is not None:
+        return journal.run_id, journal.run_started
+    return uuid.uuid4().hex, time.time()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import sys
+
+import argparse
+from answerSnapshot import save_snapshot
+from parseWAFR import PILLAR_PARSE_MAP, DEFAULT_LENS_ALIAS
+from waAnswers import fetch_answers, create_wa_client, version_tuple, BOTO3_MIN_VERSION
+
+
+logger = logging.getLogger()
+
+PARSER = argparse.ArgumentParser(
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+    description='Saves all answers of a workload to a local file that parseWAFR.py --fromSnapshot runs against'
+    )
+
+PARSER.add_argument('-r','--region', required=False, default="eu-central-1", help='From Region Name. Example: us-east-1')
+PARSER.add_argument('-w','--workloadId', required=True, help='Workload Id to take answers from')
+PARSER.add_argument('-m','--milestoneNumber', required=False, type=int, default=None, help='Milestone number to take answers from (default: the current answers of the workload)')
+PARSER.add_argument('-o','--outputFile', required=False, default=None, help='Snapshot file to write (default: <workloadId>[-<milestoneNumber>].json.gz)')
+PARSER.add_argument('-v','--debug', action='store_true', help='print debug messages to stderr')
+
+
+def main(argv=None):
+    """ Main program run """
+    arguments = PARSER.parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if arguments.debug else logging.INFO,
+        format='%(asctime)s.%(msecs)03d %(levelname)s %(module)s - %(funcName)s: %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+    )
+    logging.getLogger('boto3').setLevel(logging.CRITICAL)
+    logging.getLogger('botocore').setLevel(logging.CRITICAL)
+
+    try:
+        aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID']
+        aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
+        aws_session_token=os.environ['AWS_SESSION_TOKEN']
+    except KeyError:
+        print("""At least one of the following environment variables: AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_SESSION_TOKEN is not defined.
+          Set AWS-based variables with appropriate values, then run again""")
+        exit(1)
+
+    import boto3
+    # Verify if the version of Boto3 we are running has the wellarchitected APIs included
+    if version_tuple(boto3.__version__) < version_tuple(BOTO3_MIN_VERSION):
+        logger.error("Your Boto3 version (%s) is less than %s. You must ugprade to run this script (pip3 upgrade boto3)" % (boto3.__version__, BOTO3_MIN_VERSION))
+        sys.exit()
+
+    session = boto3.session.Session(aws_access_key_id=aws_access_key_id,
+                                    aws_secret_access_key=aws_secret_access_key,
+                                    aws_session_token=aws_session_token)
+    waclient = create_wa_client(session, arguments.region)
+    answer_set = fetch_answers(waclient, arguments.workloadId, DEFAULT_LENS_ALIAS, PILLAR_PARSE_MAP,
+                               milestone_number=arguments.milestoneNumber)
+
+    path = arguments.outputFile
+    if not path:
+        path = "{}.json.gz".format(arguments.workloadId if arguments.milestoneNumber is None
+                                   else "{}-{}".format(arguments.workloadId, arguments.milestoneNumber))
+    save_snapshot(path, answer_set, arguments.workloadId, DEFAULT_LENS_ALIAS, arguments.milestoneNumber)
+    logger.info("Saved %s answers of workload %s to %s (%s bytes)" % (len(answer_set.all()), arguments.workloadId,
+                                                                    path, os.path.getsize(path)))
+
+
+
+if __name__ == "__main__":
+    main()
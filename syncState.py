@@ -0,0 +1,53 @@
+import json
+import os
+import threading
+
+
+class SyncState:
+    """Local store of the Jira issues created for Well-Architected answers
+
+    Maps (workloadId, QuestionId) to the task and (workloadId, QuestionId, ChoiceId) to the subtask created for
+    it, together with the last seen Risk/SelectedChoices and whether the issue was already transited, so that
+    a re-run only creates and transits what changed since the previous one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.workloads = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.workloads = json.load(f)["workloads"]
+
+    def get_task(self, workload_id, question_id):
+        return self.workloads.get(workload_id, {}).get(question_id)
+
+    def set_task(self, workload_id, question_id, key, risk, selected_choices, transited):
+        with self.lock:
+            task = self.workloads.setdefault(workload_id, {}).setdefault(question_id, {"choices": {}})
+            task.update({"key": key, "risk": risk, "selected": selected_choices, "transited": transited})
+
+    def get_subtask(self, workload_id, question_id, choice_id):
+        task = self.get_task(workload_id, question_id)
+        if task is None:
+            return None
+        return task["choices"].get(choice_id)
+
+    def set_subtask(self, workload_id, question_id, choice_id, key, selected, transited):
+        with self.lock:
+            task = self.workloads[workload_id][question_id]
+            task["choices"][choice_id] = {"key": key, "selected": selected, "transited": transited}
+
+    def set_transited(self, workload_id, question_id, choice_id=None):
+        with self.lock:
+            issue = self.workloads[workload_id][question_id]
+            if choice_id is not None:
+                issue = issue["choices"][choice_id]
+            issue["transited"] = True
+
+    def save(self):
+        with self.lock:
+            tmp_path = "{}.tmp".format(self.path)
+            with open(tmp_path, "w") as f:
+                json.dump({"version": 1, "workloads": self.workloads}, f, indent=1)
+            os.replace(tmp_path, self.path)
@@ -6,43 +6,17 @@ import sys
 import os
 
 import argparse
-import botocore
-import boto3
-from parseAwsDocWebPages import get_implementation_steps
-from pkg_resources import packaging
+from waAnswers import fetch_answers, create_wa_client, version_tuple, BOTO3_MIN_VERSION
+from parseAwsDocWebPages import get_implementation_steps, configure_page_cache, DEFAULT_CACHE_DIR
 
 
 response = ""
 
 
-# Setup Logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s.%(msecs)03d %(levelname)s %(module)s - %(funcName)s: %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-)
-
 logger = logging.getLogger()
-logging.getLogger('boto3').setLevel(logging.CRITICAL)
-logging.getLogger('botocore').setLevel(logging.CRITICAL)
-PARSER = argparse.ArgumentParser(
-    formatter_class=argparse.RawDescriptionHelpFormatter,
-    )
 
 DEFAULT_LENS_ALIAS="wellarchitected"
 
-try:
-    aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID']
-    aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
-    aws_session_token=os.environ['AWS_SESSION_TOKEN']
-except KeyError:
-    print("""At least one of the following environment variables: AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_SESSION_TOKEN is not defined.
-          Set AWS-based variables with appropriate values, then run again""")
-    exit(1)
-except:
-    print("Unexpected error:", sys.exc_info()[0])
-    raise
-
 PARSER = argparse.ArgumentParser(
     formatter_class=argparse.RawDescriptionHelpFormatter
     )
@@ -53,20 +27,22 @@ PARSER.add_argument('-w','--workloadId', required=True, help='Workload Id to use
 PARSER.add_argument('-m','--milestoneNumber', required=False, default=1, help='Milestone number to take answers from')
 #PARSER.add_argument('-a','--lensAlias', required=False, default=DEFAULT_LENS_ALIAS, help='Lense alias which questions to take from') #do we need it? page parsing won't work for other lenses 
 PARSER.add_argument('-l','--lensVersion', required=False, default="latest", help='Lense version which questions to take from and appropriately for builing link to documentation')
+PARSER.add_argument('--docCacheDir', required=False, default=DEFAULT_CACHE_DIR, help='Directory to cache documentation pages in, empty string disables the cache')
+PARSER.add_argument('--offline', action='store_true', help='take documentation pages from the cache only, never from the network')
 PARSER.add_argument('-v','--debug', action='store_true', help='print debug messages to stderr')
 
-ARGUMENTS = PARSER.parse_args()
-PROFILE=ARGUMENTS.profile
-REGION=ARGUMENTS.region
-WORKLOAD_ID=ARGUMENTS.workloadId
-MILESTONE_NUMBER=ARGUMENTS.milestoneNumber
-LENS_ALIAS=DEFAULT_LENS_ALIAS
-LENS_VERSION=ARGUMENTS.lensVersion
-
-if ARGUMENTS.debug:
-    logger.setLevel(logging.DEBUG)
-else:
-    logger.setLevel(logging.INFO)
+def setup_logging(debug=False):
+    logging.basicConfig(
+        level=logging.DEBUG,
+        format='%(asctime)s.%(msecs)03d %(levelname)s %(module)s - %(funcName)s: %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+    )
+    logging.getLogger('boto3').setLevel(logging.CRITICAL)
+    logging.getLogger('botocore').setLevel(logging.CRITICAL)
+    if debug:
+        logger.setLevel(logging.DEBUG)
+    else:
+        logger.setLevel(logging.INFO)
 
 # PILLAR_PARSE_MAP = {
 #                     "operationalExcellence": "OPS",
@@ -88,13 +64,33 @@ PILLAR_PARSE_MAP = {
 
 
 
-def main():
+def main(argv=None):
     """ Main program run """
 
-    boto3_min_version = "1.16.38"
+    ARGUMENTS = PARSER.parse_args(argv)
+    if ARGUMENTS.offline and not ARGUMENTS.docCacheDir:
+        PARSER.error("--offline needs a --docCacheDir to take the pages from")
+    REGION=ARGUMENTS.region
+    WORKLOAD_ID=ARGUMENTS.workloadId
+    LENS_ALIAS=DEFAULT_LENS_ALIAS
+    LENS_VERSION=ARGUMENTS.lensVersion
+    DOC_CACHE_DIR=ARGUMENTS.docCacheDir
+    OFFLINE=ARGUMENTS.offline
+    setup_logging(ARGUMENTS.debug)
+
+    try:
+        aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID']
+        aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
+        aws_session_token=os.environ['AWS_SESSION_TOKEN']
+    except KeyError:
+        print("""At least one of the following environment variables: AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_SESSION_TOKEN is not defined.
+          Set AWS-based variables with appropriate values, then run again""")
+        exit(1)
+
+    import boto3
     # Verify if the version of Boto3 we are running has the wellarchitected APIs included
-    if packaging.version.parse(boto3.__version__) < packaging.version.parse(boto3_min_version):
-        logger.error("Your Boto3 version (%s) is less than %s. You must ugprade to run this script (pip3 upgrade boto3)" % (boto3.__version__, boto3_min_version))
+    if version_tuple(boto3.__version__) < version_tuple(BOTO3_MIN_VERSION):
+        logger.error("Your Boto3 version (%s) is less than %s. You must ugprade to run this script (pip3 upgrade boto3)" % (boto3.__version__, BOTO3_MIN_VERSION))
         sys.exit()
 
     logger.info("Starting Boto %s Session" % boto3.__version__)
@@ -103,42 +99,15 @@ def main():
     SESSION1 = boto3.session.Session(aws_access_key_id=aws_access_key_id,
                                      aws_secret_access_key=aws_secret_access_key,
                                      aws_session_token=aws_session_token)
-    WACLIENT = SESSION1.client(
-        service_name='wellarchitected',
-        region_name=REGION
-    )
+    WACLIENT = create_wa_client(SESSION1, REGION)
+
+    configure_page_cache(DOC_CACHE_DIR, offline=OFFLINE)
 
+    answer_set = fetch_answers(WACLIENT, WORKLOAD_ID, LENS_ALIAS, PILLAR_PARSE_MAP)
     for pillar in PILLAR_PARSE_MAP:
-        answers = []
+        answers = answer_set.pillar(pillar)
         choices = []
         choiceIds = []
-        logger.debug("Grabbing answers for %s %s" % (LENS_ALIAS, pillar))
-        # Find a questionID using the questionTitle
-        try:
-            response = WACLIENT.list_answers(
-                WorkloadId=WORKLOAD_ID,
-                LensAlias=LENS_ALIAS,
-                PillarId=pillar
-            )
-        except botocore.exceptions.ParamValidationError as e:
-            logger.error("ERROR - Parameter validation error: %s" % e)
-        except botocore.exceptions.ClientError as e:
-            logger.error("ERROR - Unexpected error: %s" % e)
-
-        # logger.debug("%s" % json.dumps(response, indent = 4))
-        # choiceIds.extend(response["AnswerSummaries"]["Choices"]["ChoiceId"])
-        answers.extend(response["AnswerSummaries"])
-        while "NextToken" in response:
-            try:
-                response = WACLIENT.list_answers(WorkloadId=WORKLOAD_ID,
-                                                 LensAlias=LENS_ALIAS,
-                                                 PillarId=pillar,
-                                                 NextToken=response["NextToken"])
-            except botocore.exceptions.ParamValidationError as e:
-                logger.error("ERROR - Parameter validation error: %s" % e)
-            except botocore.exceptions.ClientError as e:
-                logger.error("ERROR - Unexpected error: %s" % e)
-            answers.extend(response["AnswerSummaries"])
         for answer in answers:
             logger.debug("choices:\n%s" % (answer["Choices"]))
             choices.extend(answer["Choices"])
@@ -150,7 +119,7 @@ def main():
         for choiceId in choiceIds:
             url = "https://docs.aws.amazon.com/wellarchitected/{}/framework/{}.html".format(LENS_VERSION, choiceId)
             try:
-                steps = get_implementation_steps(url)
+                steps = get_implementation_steps(url, LENS_VERSION)
             except ValueError as e:
                 logger.error("ERROR - Value error: %s" % e)
             else:
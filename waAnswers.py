@@ -0,0 +1,94 @@
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from lazyLog import LazyJson
+from metrics import metrics
+
+# The first boto3 version with the Well-Architected API
+BOTO3_MIN_VERSION = "1.16.38"
+# One connection per pillar fetched in parallel, plus some room for the other WA calls of the run
+DEFAULT_MAX_POOL_CONNECTIONS = 10
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerSet:
+    """All answers of a workload, indexed by pillar and by QuestionId
+
+    Every answer gets its 1-based position within its pillar as "Index", the number of its question page.
+    """
+
+    def __init__(self, answers_by_pillar):
+        self.by_pillar = answers_by_pillar
+        self.by_question = {}
+        for answers in answers_by_pillar.values():
+            for i, answer in enumerate(answers, start=1):
+                answer["Index"] = i
+                self.by_question[answer["QuestionId"]] = answer
+
+    def pillar(self, pillar):
+        return self.by_pillar.get(pillar, [])
+
+    def question(self, question_id):
+        return self.by_question.get(question_id)
+
+    def all(self):
+        return [answer for answers in self.by_pillar.values() for answer in answers]
+
+
+def version_tuple(version):
+    # "1.16.38" -> (1, 16, 38), enough to compare release versions without pkg_resources
+    return tuple(int(part) for part in re.findall(r"\d+", version)[:3])
+
+def create_wa_client(session, region, max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS):
+    # botocore is imported on first use, so that importing this module stays cheap
+    from botocore.config import Config
+    # boto3 clients are thread safe, one client with a big enough connection pool serves all the fetcher threads
+    return session.client(
+        service_name='wellarchitected',
+        region_name=region,
+        config=Config(max_pool_connections=max_pool_connections, retries={"mode": "adaptive"})
+    )
+
+def list_pillar_answers(waclient, workload_id, lens_alias, pillar, milestone_number=None):
+    import botocore.exceptions
+    answers = []
+    logger.debug("Grabbing answers for %s %s" % (lens_alias, pillar))
+    kwargs = {"WorkloadId": workload_id, "LensAlias": lens_alias, "PillarId": pillar}
+    if milestone_number is not None:
+        kwargs["MilestoneNumber"] = int(milestone_number)
+    while True:
+        started = time.monotonic()
+        try:
+            response = waclient.list_answers(**kwargs)
+        except botocore.exceptions.ParamValidationError as e:
+            metrics.observe("wa", "list_answers", time.monotonic() - started, error=True)
+            logger.error("ERROR - Parameter validation error: %s" % e)
+            raise
+        except botocore.exceptions.ClientError as e:
+            metrics.observe("wa", "list_answers", time.monotonic() - started, error=True,
+                            retries=e.response.get("ResponseMetadata", {}).get("RetryAttempts", 0))
+            logger.error("ERROR - Unexpected error: %s" % e)
+            raise
+        # boto3 retries throttled calls by itself, and reports how many times it did
+        metrics.observe("wa", "list_answers", time.monotonic() - started,
+                        retries=response.get("ResponseMetadata", {}).get("RetryAttempts", 0))
+        logger.debug("response: %s", LazyJson(response))
+        answers.extend(response["AnswerSummaries"])
+        if "NextToken" not in response:
+            break
+        kwargs["NextToken"] = response["NextToken"]
+    return answers
+
+def fetch_answers(waclient, workload_id, lens_alias, pillars, max_workers=None, milestone_number=None):
+    """Pages through the answers of all `pillars` at the same time, returns them as an AnswerSet
+
+    Answers are taken from milestone `milestone_number` if given, else from the current state of the workload.
+    """
+    pillars = list(pillars)
+    with ThreadPoolExecutor(max_workers=max_workers or len(pillars) or 1) as executor:
+        answers = executor.map(lambda pillar: list_pillar_answers(waclient, workload_id, lens_alias, pillar,
+                                                                  milestone_number), pillars)
+        return AnswerSet(dict(zip(pillars, answers)))